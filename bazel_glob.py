@@ -0,0 +1,165 @@
+"""Bazel-style glob() over a shared directory listing cache.
+
+Each directory is read once per run with os.scandir and its listing is
+reused by every later glob() that reaches it.  The include and exclude
+patterns of a call are each compiled into a single regular expression,
+with Bazel semantics: "*" matches within one path segment and a "**"
+segment matches any number of directories.  Like Bazel, globs do not
+descend into subpackages (directories with their own BUILD file), only
+return files, and return package-relative paths in sorted order.
+"""
+
+import functools
+import os
+import re
+import threading
+
+BUILD_FILES = ("BUILD", "BUILD.bazel")
+
+_listings = {}
+_listings_lock = threading.Lock()
+
+
+def clear_cache():
+    """Forgets every cached listing, e.g. after the tree changed."""
+    with _listings_lock:
+        _listings.clear()
+
+
+def forget(directory):
+    """Forgets the cached listing of directory, which has changed."""
+    directory = os.path.abspath(directory)
+    with _listings_lock:
+        for path in [p for p in _listings if os.path.abspath(p) == directory]:
+            del _listings[path]
+
+
+def listing(path):
+    """Returns (files, dirs) of the directory at path, scanning it once."""
+    path = os.path.normpath(path)
+    with _listings_lock:
+        cached = _listings.get(path)
+    if cached is not None:
+        return cached
+    files = []
+    dirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                (dirs if is_dir else files).append(entry.name)
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    cached = (frozenset(files), tuple(sorted(dirs)))
+    with _listings_lock:
+        _listings[path] = cached
+    return cached
+
+
+def _translate(pattern):
+    segments = pattern.split("/")
+    regex = ""
+    for i, segment in enumerate(segments):
+        last = i == len(segments) - 1
+        if segment == "**":
+            regex += ".*" if last else "(?:.*/)?"
+        else:
+            regex += "[^/]*".join(re.escape(p) for p in segment.split("*"))
+            if not last:
+                regex += "/"
+    return regex
+
+
+@functools.lru_cache(maxsize = 1024)
+def _compile(patterns):
+    return re.compile("|".join("(?:%s)" % _translate(p) for p in patterns))
+
+
+def compile_patterns(patterns):
+    """Returns a matcher for package-relative paths, or None if empty."""
+    if not patterns:
+        return None
+    return _compile(tuple(patterns))
+
+
+def _walk_roots(patterns):
+    """Yields (static prefix, max depth) for each pattern.
+
+    The prefix is the leading run of segments without wildcards; depth
+    is how many more directory levels the pattern can reach, or None
+    when it contains "**".
+    """
+    for pattern in patterns:
+        segments = pattern.split("/")
+        prefix = []
+        for segment in segments[:-1]:
+            if "*" in segment:
+                break
+            prefix.append(segment)
+        rest = segments[len(prefix):]
+        depth = None if "**" in rest else len(rest) - 1
+        yield "/".join(prefix), depth
+
+
+def _in_subpackage(package_dir, prefix):
+    """Tells whether prefix is in a subpackage of package_dir, i.e. any
+    directory on the way to it has a BUILD file."""
+    rel = ""
+    for segment in prefix.split("/") if prefix else ():
+        rel = rel + "/" + segment if rel else segment
+        files, _ = listing(os.path.join(package_dir, rel))
+        if any(b in files for b in BUILD_FILES):
+            return True
+    return False
+
+
+def _candidates(package_dir, prefix, depth, out):
+    if _in_subpackage(package_dir, prefix):
+        return
+    stack = [(prefix, depth)]
+    while stack:
+        rel, remaining = stack.pop()
+        files, dirs = listing(os.path.join(package_dir, rel))
+        base = rel + "/" if rel else ""
+        for name in files:
+            out.add(base + name)
+        if remaining == 0:
+            continue
+        for name in dirs:
+            sub_files, _ = listing(os.path.join(package_dir, base + name))
+            if any(b in sub_files for b in BUILD_FILES):
+                # A subpackage; its files belong to it, not to us.
+                continue
+            stack.append((base + name, None if remaining is None else remaining - 1))
+
+
+def glob(package_dir, include, exclude = ()):
+    """Returns the sorted package-relative files under package_dir matching
+    include and not exclude."""
+    package_dir = os.path.abspath(package_dir)
+    include_re = compile_patterns(include)
+    if include_re is None:
+        return []
+    literal_excludes = set(p for p in exclude if "*" not in p)
+    exclude_re = compile_patterns([p for p in exclude if "*" in p])
+
+    roots = {}
+    for prefix, depth in _walk_roots(include):
+        if prefix not in roots or depth is None or (
+                roots[prefix] is not None and depth > roots[prefix]):
+            roots[prefix] = depth
+    candidates = set()
+    for prefix, depth in roots.items():
+        covered = any(
+            roots[other] is None and (other == "" or prefix.startswith(other + "/"))
+            for other in roots if other != prefix)
+        if not covered:
+            _candidates(package_dir, prefix, depth, candidates)
+
+    return sorted(
+        f for f in candidates
+        if f not in literal_excludes and include_re.fullmatch(f) and
+        (exclude_re is None or not exclude_re.fullmatch(f)))
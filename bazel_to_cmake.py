@@ -22,34 +22,48 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import glob
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import multiprocessing
 import os
+import signal
 import sys
 import textwrap
+import time
 import requests
-from converter import Converter
+from converter import Converter, register_emitter
+import bazel_glob
+import code_cache
+import fetch
 import git
-import wget
-import tarfile
-import zipfile
-
-def StripColons(deps):
-  return map(lambda x: x[1:], deps)
+import git_mirror
+import incremental
+import modules
+import packages
+import repository_index
+import rules
+import static_build
+import target_graph
+import tracing
+import watch
+
+# What Bazel's cc rules compile, and what they treat as headers.
+SOURCE_EXTENSIONS = (".c", ".cc", ".cpp", ".cxx", ".c++", ".C", ".S", ".s")
+HEADER_EXTENSIONS = (".h", ".hh", ".hpp", ".hxx", ".h++", ".H", ".inc",
+                     ".inl", ".ipp", ".tcc")
 
 def IsSourceFile(name):
-  return name.endswith(".c") or name.endswith(".cc")
+  return name.endswith(SOURCE_EXTENSIONS)
+
+def IsHeaderFile(name):
+  return name.endswith(HEADER_EXTENSIONS)
 
 data = {}
 interpreter_curdir = [os.curdir]
 
-def GetDict(obj):
-    ret = {}
-    for k in dir(obj):
-        if not k.startswith("__"):
-            ret[k] = getattr(obj, k)
-    return ret
-
-loaded_projects = {}
+repositories = repository_index.RepositoryIndex()
 
 class BuildFileFunctions(object):
     class struct:
@@ -111,14 +125,13 @@ class BuildFileFunctions(object):
         # assert False
 
 
-    def __add_deps(self, kwargs, keyword=""):
-        if "deps" not in kwargs:
-            return
-        self.converter.toplevel += "target_link_libraries(%s%s\n  %s)\n" % (
-            kwargs["name"],
-            keyword,
-            "\n  ".join(StripColons(kwargs["deps"]))
-        )
+    def _source_path(self, f):
+        """Returns f, given relative to the current package, relative to the
+        project being generated instead."""
+        package = os.path.relpath(interpreter_curdir[-1], self.converter.proj_dir)
+        if package == os.curdir or f.startswith(":") or f.startswith("//"):
+            return f
+        return os.path.join(package, f)
 
     def gazelle(self, *args, **kwargs):
         name = kwargs.get("name")
@@ -176,11 +189,10 @@ class BuildFileFunctions(object):
 
     def load(self, *args, **kwargs):
         print(args, kwargs)
-        if len(args) < 2:
+        if len(args) + len(kwargs) < 2:
             print("Skipping invalid load: " + str(args) + " " + str(kwargs))
             return
         url = args[0]
-        name = args[1]
         print("Loading: " + str(args) + " " + str(kwargs))
         if url.startswith("@bazel_tools"):
             return
@@ -191,9 +203,7 @@ class BuildFileFunctions(object):
                 bazel_tools_repo = "https://github.com/bazelbuild/bazel.git"
                 git.Git(interpreter_curdir[-1]).clone(bazel_tools_repo)
             file_path, bazel_file = url.split("//")[1].split(":")
-            interpreter_curdir.append(os.path.abspath(os.path.join(bazel_src, file_path)))
-            load_bazel_file(self.converter, os.path.join(bazel_src, file_path, bazel_file))
-            interpreter_curdir.pop()
+            filename = os.path.join(bazel_src, file_path, bazel_file)
         elif url.startswith("@io_bazel"):
             return
         elif url.startswith("@"):
@@ -214,20 +224,18 @@ class BuildFileFunctions(object):
                 bazel_src = os.path.abspath(os.path.join(interpreter_curdir[-1], bazel_repo))
                 bazel_url_repo = "https://github.com/bazelbuild/"+bazel_repo+".git"
 
-            if not os.path.exists(bazel_src):
-                os.makedirs(bazel_src, exist_ok = True)
-                git.Git(interpreter_curdir[-1]).clone(bazel_url_repo)
             file_path, bazel_file = url.split("//")[1].split(":")
-            interpreter_curdir.append(os.path.abspath(os.path.join(bazel_src, file_path)))
-            load_bazel_file(self.converter, os.path.join(bazel_src, file_path, bazel_file))
-            interpreter_curdir.pop()
-
+            commit = git_mirror.pinned_commit(bazel_url_repo, pins_file)
+            repository = repositories.declare(
+                url[1:].split("//")[0],
+                repository_index.git_identity(bazel_url_repo, commit),
+                bazel_src)
+            git_mirror.checkout(bazel_url_repo, repository.path, [file_path],
+                                commit)
+            packages.mark_external(repository.path)
+            filename = os.path.join(repository.path, file_path, bazel_file)
         elif url.startswith(":"):
-            if name not in loaded_projects.keys():
-                loaded_projects.update({name: None})
-                # Local file, do nothing
-                bazel_file = url.replace(":", "")
-                load_bazel_file(self.converter, os.path.abspath(os.path.join(interpreter_curdir[-1], bazel_file)))
+            filename = os.path.join(interpreter_curdir[-1], url[1:])
         elif url.startswith("//closure"):
             # Skip closure defs
             return
@@ -237,37 +245,39 @@ class BuildFileFunctions(object):
                 bazel_closure_repo = "https://github.com/bazelbuild/rules_closure.git"
                 git.Git(os.path.abspath(interpreter_curdir[-1])).clone(bazel_closure_repo)
 
-            load_bazel_file(self.converter, os.path.join(closure_src, "BUILD"))
+            load_bazel_file(os.path.join(closure_src, "BUILD"))
         elif url.startswith("//"):
-            # Local file, do nothing
-            if name not in loaded_projects.keys():
-                loaded_projects.update({name: None})
-                bazel_dir, bazel_file = url.replace("//", "").split(":")
-                load_bazel_file(self.converter, os.path.abspath(os.path.join(interpreter_curdir[-1], bazel_dir, bazel_file)))
+            bazel_dir, bazel_file = url[2:].split(":")
+            filename = os.path.join(packages.repository_root(interpreter_curdir[-1]),
+                                    bazel_dir, bazel_file)
         else:
             print(args, kwargs)
             assert False
 
+        # Bind only the requested symbols, possibly under local aliases.
+        module = load_bazel_file(filename, url)
+        namespace = rules.current_namespace()
+        for local, symbol in [(s, s) for s in args[1:]] + list(kwargs.items()):
+            assert symbol in module.symbols, \
+                "%s does not export %s" % (module.label, symbol)
+            namespace[local] = module.symbols[symbol]
+
     def cc_library(self, **kwargs):
         if kwargs["name"] == "amalgamation" or kwargs["name"] == "upbc_generator":
             return
-        files = kwargs.get("srcs", []) + kwargs.get("hdrs", [])
-
-        if filter(IsSourceFile, files):
-            # Has sources, make this a normal library.
-            self.converter.toplevel += "add_library(%s\n  %s)\n" % (
-                kwargs["name"],
-                "\n  ".join(files)
-            )
-            self.__add_deps(kwargs)
-        else:
-            # Header-only library, have to do a couple things differently.
-            # For some info, see:
-            #  http://mariobadr.com/creating-a-header-only-library-with-cmake.html
-            self.converter.toplevel += "add_library(%s INTERFACE)\n" % (
-              kwargs["name"]
-            )
-            self.__add_deps(kwargs, " INTERFACE")
+        package = os.path.relpath(interpreter_curdir[-1], self.converter.proj_dir)
+        self.converter.add_target(target_graph.Target(
+            "cc_library", "" if package == os.curdir else package,
+            kwargs["name"],
+            srcs = [self._source_path(f) for f in kwargs.get("srcs", [])],
+            hdrs = [self._source_path(f) for f in kwargs.get("hdrs", [])],
+            deps = kwargs.get("deps", []),
+            copts = kwargs.get("copts", []),
+            linkopts = kwargs.get("linkopts", []),
+            textual_hdrs = [self._source_path(f)
+                            for f in kwargs.get("textual_hdrs", [])],
+            linkstatic = kwargs.get("linkstatic", False),
+            alwayslink = kwargs.get("alwayslink", False)))
 
     def cc_binary(self, **kwargs):
         pass
@@ -327,7 +337,7 @@ class BuildFileFunctions(object):
     def exports_files(self, files, **kwargs):
         for f in files:
             if f.endswith(".bzl"):
-                load_bazel_file(self.converter, os.path.abspath(os.path.join(interpreter_curdir[-1], f)))
+                load_bazel_file(os.path.join(interpreter_curdir[-1], f))
         # assert False, "Failed to make export files"
 
     def filegroup(self, **kwargs):
@@ -363,9 +373,9 @@ class BuildFileFunctions(object):
 
         for d in deps:
             d_dir, d_file = d.replace("//", "").split(":")
-            load_bazel_file(self.converter, os.path.abspath(os.path.join(interpreter_curdir[-1], d_dir, d_file)))
+            load_bazel_file(os.path.join(interpreter_curdir[-1], d_dir, d_file))
         b_dir, b_file = srcs.replace("//", "").split(":")
-        load_bazel_file(self.converter, os.path.abspath(os.path.join(interpreter_curdir[-1], b_dir, bfile)))
+        load_bazel_file(os.path.join(interpreter_curdir[-1], b_dir, bfile))
         assert False
 
     def genrule(self, **kwargs):
@@ -381,13 +391,14 @@ class BuildFileFunctions(object):
         # TODO: store selections (this will become if statements)
         return []
 
-    def glob(self, *args, **kwargs):
-        patterns = args[0]
-        total_files = []
-        for pat in patterns:
-            total_files.extend(glob.glob( os.path.abspath(os.path.join(interpreter_curdir[-1], pat)) ))
-        exclude = kwargs.get("exclude", [])
-        return list(filter(lambda f: f not in exclude, total_files))
+    def glob(self, include = [], exclude = [], **kwargs):
+        package_dir = interpreter_curdir[-1]
+        with tracing.span(package_dir, "glob", include = list(include),
+                          exclude = list(exclude)):
+            files = bazel_glob.glob(package_dir, include, exclude)
+        if manifest is not None:
+            manifest.record_glob(package_dir, include, exclude, files)
+        return files
 
     def licenses(self, *args):
         # assert False, "Failed to licenses"
@@ -440,100 +451,958 @@ class WorkspaceFileFunctions(BuildFileFunctions):
 
     def workspace(self, **kwargs):
         name = kwargs.get("name")
-        self.converter.prelude += "project(%s)\n" % (name)
+        self.converter.add_prelude("project(%s)\n" % (name))
 
     def local_repository(self, **kwargs):
         name = kwargs.get("name")
         path = kwargs.get("path")
-        print("Loading subproject: " + name)
-        if name not in loaded_projects.keys():
-            loaded_projects.update({name: None})
-            repo_dir = os.path.abspath(os.path.join(interpreter_curdir[-1], path))
-            interpreter_curdir.append(repo_dir)
-            subproject = load_subproject(proj_dir = repo_dir)
-            loaded_projects.update({name: subproject})
-            self.converter.add_subproject(subproject)
-            interpreter_curdir.pop()
+        repo_dir = os.path.abspath(os.path.join(interpreter_curdir[-1], path))
+        repositories.declare(name, repository_index.local_identity(repo_dir),
+                             repo_dir, self.converter, kwargs)
+        def load():
+            repository, first = repositories.claim(name)
+            if first:
+                print("Loading subproject: " + name)
+                interpreter_curdir.append(repository.path)
+                repository.subproject = load_subproject(proj_dir = repository.path)
+                repository.owner.add_subproject(repository.subproject)
+                interpreter_curdir.pop()
+            _map_repository(self.converter, name, repository)
+        self.converter.add_repository(name, load)
 
     def http_archive(self, **kwargs):
         name = kwargs.get("name")
-        urls = kwargs.get("urls")
-        url = kwargs.get("url")
-        # handle the case when there is only one URL, make a list of 1
-        if urls is None:
-            urls = [url]
-
-        strip_prefix = kwargs.get("strip_prefix")
-        if name not in loaded_projects.keys():
+        urls = fetch.archive_urls(kwargs)
+        # Only strip_prefix is extracted, straight into dest_dir.
+        dest_dir = os.path.abspath(os.path.join(interpreter_curdir[-1], name))
+        repositories.declare(
+            name, repository_index.archive_identity(
+                urls, kwargs.get("sha256"), kwargs.get("strip_prefix")),
+            dest_dir, self.converter, kwargs,
+            repository_index.parse_version(kwargs.get("strip_prefix"), *urls))
+        def load():
+            repository, first = repositories.claim(name)
+            if first:
+                load_archive(repository)
+            # Loaded now, or already, possibly under another name.
+            _map_repository(self.converter, name, repository)
+        def load_archive(repository):
+            extracted_dir = repository.path
+            attrs = repository.attrs
+            owner = repository.owner
             print("Fetching: " + name)
-            dest_dir = os.path.abspath(os.path.join(interpreter_curdir[-1], name))
-            extracted_dir = os.path.abspath(os.path.join(dest_dir, strip_prefix))
-            for url in urls:
-                filename = url.split("/")[-1]
-                if not os.path.exists(os.path.join(dest_dir, strip_prefix)):
-                    os.makedirs(dest_dir, exist_ok = True)
-                    try:
-                        wget.download(url, out = os.path.join(dest_dir, filename))
-                        # Extract
-                        if filename.endswith("tar.gz"):
-                            print("Extracting tar")
-                            tf = tarfile.open(os.path.join(dest_dir, filename))
-                            tf.extractall(path = dest_dir)
-                            break
-                        elif filename.endswith(".zip"):
-                            with zipfile.ZipFile(os.path.join(dest_dir, filename), 'r') as zip_ref:
-                                zip_ref.extractall(dest_dir)
-                            break
-                        else:
-                            assert False, "Unknown file archive format"
-                    except:
-                        print("Failed to get repository")
+            if not os.path.exists(extracted_dir):
+                try:
+                    fetch.fetch_archive(name, fetch.archive_urls(attrs),
+                                        extracted_dir, attrs.get("strip_prefix"),
+                                        attrs.get("sha256"), attrs.get("type"))
+                except Exception as e:
+                    print("Failed to get repository: " + str(e))
+            packages.mark_external(extracted_dir)
 
             if os.path.exists(os.path.join(extracted_dir, "WORKSPACE")):
-                loaded_projects.update({name: None})
                 interpreter_curdir.append(extracted_dir)
-                subproject = load_subproject(proj_dir = extracted_dir)
-                loaded_projects.update({name: subproject})
-                self.converter.add_subproject(subproject)
+                repository.subproject = load_subproject(proj_dir = extracted_dir)
+                owner.add_subproject(repository.subproject)
                 interpreter_curdir.pop()
             elif os.path.exists(os.path.join(extracted_dir, "BUILD")):
-                loaded_projects.update({name: None})
-                load_bazel_file(self.converter, os.path.join(extracted_dir, "BUILD"))
-                loaded_projects.update({name: None})
+                load_package(owner, os.path.join(extracted_dir, "BUILD"))
             elif os.path.exists(os.path.join(extracted_dir, "CMakeLists.txt")):
-                loaded_projects.update({name: None})
                 print("Found CMake Project!")
             else:
-                print(kwargs)
+                print(attrs)
                 assert False, "Failed to get repository"
+        self.converter.add_repository(name, load)
 
     def git_repository(self, **kwargs):
         assert False, "Failed to get git repository"
 
-converter = Converter(os.curdir)
-
-my_globs = {}
-
-def load_bazel_file(converter, filename):
-    with open(filename, "r") as f:
+def _map_repository(converter, name, repository):
+    """Makes the labels converter uses for repository name refer to the
+    targets of the repository, wherever it was loaded.
+
+    A repository with a WORKSPACE is a subproject, and one with only a
+    BUILD file was loaded into the package graph of the converter that
+    declared it first; every other converter reaches its targets by
+    their CMake names.
+    """
+    if repository.subproject is not None:
+        converter.map_repository(name, "", external = True)
+    elif os.path.exists(os.path.join(repository.path, "BUILD")):
+        owner = repository.owner
+        converter.map_repository(
+            name, os.path.relpath(repository.path, owner.proj_dir),
+            external = converter is not owner)
+
+manifest = None
+module_cache = modules.ModuleCache()
+# The git pins file of the workspace being converted; None for the one
+# in the current directory.
+pins_file = None
+jobs = 1
+performance = False
+
+BUILD_RULES = rules.RuleSet.from_class(BuildFileFunctions)
+WORKSPACE_RULES = rules.RuleSet.from_class(WorkspaceFileFunctions)
+
+def register_rule(name, handler, workspace = False):
+    """Makes handler callable as name from BUILD and .bzl files.
+
+    handler is called like a method, as handler(context, *args, **kwargs),
+    where context.converter is the Converter of the package being
+    evaluated.  Rules registered with workspace = True are only visible
+    to WORKSPACE files; the others are visible to WORKSPACE files too.
+    """
+    global BUILD_RULES, WORKSPACE_RULES
+    if not workspace:
+        BUILD_RULES = BUILD_RULES.extend({name: handler})
+    WORKSPACE_RULES = WORKSPACE_RULES.extend({name: handler})
+
+def _is_header_only(target):
+    """Tells whether target has nothing to compile; headers may be in
+    srcs too, as private headers."""
+    return not any(IsSourceFile(f) for f in target.srcs)
+
+def _library_kind(target):
+    """Returns the add_library() type of target: INTERFACE when it has
+    nothing to compile, STATIC for linkstatic and alwayslink (which its
+    users link whole, see _link_item()), and otherwise none, so
+    BUILD_SHARED_LIBS decides."""
+    if _is_header_only(target):
+        return "INTERFACE"
+    if target.linkstatic or target.alwayslink:
+        return "STATIC"
+    return ""
+
+def _link_keyword(target):
+    """Returns how target passes its deps on to the targets using it."""
+    if _is_header_only(target):
+        return "INTERFACE"
+    if target.hdrs or target.textual_hdrs:
+        # Its headers may include those of its deps.
+        return "PUBLIC"
+    return "PRIVATE"
+
+def _propagates_deps(target):
+    return _link_keyword(target) != "PRIVATE"
+
+def _link_item(graph, index):
+    """Returns how target index appears in the link lines of its users:
+    every object of an alwayslink library is linked, as Bazel does, with
+    the whole-archive flags the template sets up."""
+    if not graph.targets[index].alwayslink or \
+            _is_header_only(graph.targets[index]):
+        return graph.cmake_name(index)
+    return ("${BAZEL_TO_CMAKE_WHOLE_ARCHIVE_BEGIN}%s"
+            "${BAZEL_TO_CMAKE_WHOLE_ARCHIVE_END}" % graph.cmake_name(index))
+
+def _add_deps(graph, index, keyword):
+    target = graph.targets[index]
+    if not target.deps and not target.linkopts:
+        return ""
+    kept, _ = graph.transitive_reduction(_propagates_deps)
+    deps = [_link_item(graph, i) for i in kept[index]]
+    for dep in graph.unresolved(index):
+        if not graph.resolve(dep, target.package).startswith("@"):
+            # Names no target; reported by report_unresolved_deps().
+            continue
+        deps.append(graph.external_name(dep, target.package) or dep[1:])
+    deps.extend(target.linkopts)
+    if not deps:
+        return ""
+    return "target_link_libraries(%s %s\n  %s)\n" % (
+        graph.cmake_name(index),
+        keyword,
+        "\n  ".join(deps)
+    )
+
+def _relative_source(path, source_dir):
+    if not source_dir or path.startswith(":") or path.startswith("//"):
+        return path
+    return os.path.relpath(path, source_dir).replace(os.sep, "/")
+
+# Targets with fewer sources gain nothing from a unity build.
+UNITY_MIN_SOURCES = 3
+UNITY_MAX_BATCH_SIZE = 16
+# Headers of libraries with at least this many direct dependents are
+# precompiled.
+PCH_MIN_DEPENDENTS = 3
+
+def unity_batch_size(sources):
+    """Returns how many sources to merge per unity file: about a quarter
+    of them, so a target still builds as a few parallel jobs, but never
+    so many that a single job dominates the build."""
+    return min(UNITY_MAX_BATCH_SIZE, max(2, (sources + 3) // 4))
+
+def _performance_hints(graph, index, source_dir):
+    """Returns the unity build and precompiled header settings of a
+    target with sources.
+
+    The headers are precompiled PRIVATE, for the target's own sources;
+    made PUBLIC, they would be force-included into every dependent too.
+    """
+    target = graph.targets[index]
+    text = ""
+    sources = [f for f in target.srcs if IsSourceFile(f)]
+    if len(sources) >= UNITY_MIN_SOURCES:
+        text += ("set_target_properties(%s PROPERTIES\n"
+                 "  UNITY_BUILD ON\n"
+                 "  UNITY_BUILD_BATCH_SIZE %d)\n" % (
+                     graph.cmake_name(index), unity_batch_size(len(sources))))
+    headers = [h for h in target.hdrs
+               if IsHeaderFile(h) and not h.startswith(":") and
+               not h.startswith("//")]
+    if headers and len(graph.rdeps(index)) >= PCH_MIN_DEPENDENTS:
+        text += ("if(COMMAND target_precompile_headers)\n"
+                 "  target_precompile_headers(%s PRIVATE\n    %s)\n"
+                 "endif()\n" % (
+                     graph.cmake_name(index), "\n    ".join(
+                         "${CMAKE_CURRENT_SOURCE_DIR}/" +
+                         _relative_source(h, source_dir) for h in headers)))
+    return text
+
+def emit_cc_library(graph, index, source_dir):
+    target = graph.targets[index]
+    files = [_relative_source(f, source_dir) for f in target.srcs + target.hdrs]
+    textual = [_relative_source(f, source_dir) for f in target.textual_hdrs]
+
+    keyword = _link_keyword(target)
+    kind = _library_kind(target)
+    if kind != "INTERFACE":
+        # Has sources, make this a normal library.
+        text = "add_library(%s%s\n  %s)\n" % (
+            graph.cmake_name(index),
+            " " + kind if kind else "",
+            "\n  ".join(files + textual)
+        )
+        if textual:
+            # Included by other files, never compiled on their own.
+            text += ("set_source_files_properties(\n  %s\n"
+                     "  PROPERTIES HEADER_FILE_ONLY ON)\n" % "\n  ".join(textual))
+        text += _add_deps(graph, index, keyword)
+    else:
+        # Header-only library, have to do a couple things differently.
+        # For some info, see:
+        #  http://mariobadr.com/creating-a-header-only-library-with-cmake.html
+        text = "add_library(%s INTERFACE)\n" % (
+          graph.cmake_name(index)
+        )
+        text += _add_deps(graph, index, keyword)
+    if kind == "INTERFACE":
+        # copts only apply to the target's own sources, and it has none.
+        return text
+    if target.copts:
+        text += "target_compile_options(%s PRIVATE\n  %s)\n" % (
+            graph.cmake_name(index), "\n  ".join(target.copts))
+    if performance:
+        text += _performance_hints(graph, index, source_dir)
+    return text
+
+register_emitter("cc_library", emit_cc_library)
+
+def report_removed_deps(converter):
+    """Prints the deps that transitive reduction dropped from the link
+    lines of converter and its subprojects."""
+    graph = converter.graph
+    _, removed = graph.transitive_reduction(_propagates_deps)
+    for index, dep, via in removed:
+        print("Removed dep %s -> %s (%s)" % (
+            graph.targets[index].label, graph.targets[dep].label,
+            "duplicate" if via is None else "via " + graph.targets[via].label))
+    print("Removed %d redundant deps from %s" % (len(removed), converter.proj_dir))
+    for subproject in converter.subprojects:
+        report_removed_deps(subproject)
+
+def _source_file(graph, target, f):
+    """Returns the project-relative path of the file f that target names,
+    or None if f is the output of a rule or in another repository."""
+    if f.startswith("@"):
+        return None
+    if not f.startswith(":") and not f.startswith("//"):
+        return f
+    label = target_graph.canonical_label(f, target.package)
+    if label in graph.by_label:
+        return None
+    return os.path.join(target_graph.package_of(label),
+                        label[label.index(":") + 1:])
+
+def missing_sources(converter):
+    """Returns (label, path) for every file named by a target of
+    converter or its subprojects that does not exist.
+
+    Every path is looked up in the shared directory listing cache, so
+    each directory is scanned once and each file costs a set lookup.
+    """
+    graph = converter.graph
+    # Absolute, like the paths glob() lists, so those listings are reused.
+    proj_dir = os.path.abspath(converter.proj_dir)
+    files = {}
+    missing = []
+    for target in graph.targets:
+        for f in target.srcs + target.hdrs + target.textual_hdrs:
+            path = _source_file(graph, target, f)
+            if path is None:
+                continue
+            directory, _, name = path.rpartition(os.sep)
+            listed = files.get(directory)
+            if listed is None:
+                listed = files[directory] = bazel_glob.listing(
+                    os.path.join(proj_dir, directory))[0]
+            if name not in listed:
+                missing.append((target.label, path))
+    for subproject in converter.subprojects:
+        missing.extend(missing_sources(subproject))
+    return missing
+
+def report_missing_sources(converter):
+    """Prints every missing source file at once, by target."""
+    with tracing.span(converter.proj_dir, "validate"):
+        missing = missing_sources(converter)
+    if not missing:
+        return
+    by_target = collections.OrderedDict()
+    for label, path in missing:
+        by_target.setdefault(label, []).append(path)
+    print("%d files named by %d targets do not exist (or are generated by "
+          "rules that are not converted):" % (len(missing), len(by_target)))
+    for label, paths in by_target.items():
+        print("  %s: %s" % (label, ", ".join(paths)))
+
+def unresolved_deps(converter):
+    """Returns (label, dep) for every dep of a target of converter or
+    its subprojects that should name a target of the project but does
+    not; such deps are left out of the link lines."""
+    graph = converter.graph
+    unresolved = []
+    for index, target in enumerate(graph.targets):
+        for dep in graph.unresolved(index):
+            dep = graph.resolve(dep, target.package)
+            if not dep.startswith("@"):
+                unresolved.append((target.label, dep))
+    for subproject in converter.subprojects:
+        unresolved.extend(unresolved_deps(subproject))
+    return unresolved
+
+def report_unresolved_deps(converter):
+    """Prints every dep that names no target, by target."""
+    unresolved = unresolved_deps(converter)
+    if not unresolved:
+        return
+    by_target = collections.OrderedDict()
+    for label, dep in unresolved:
+        by_target.setdefault(label, []).append(dep)
+    print("%d deps of %d targets name no target (or one made by a rule "
+          "that is not converted):" % (len(unresolved), len(by_target)))
+    for label, deps in by_target.items():
+        print("  %s: %s" % (label, ", ".join(deps)))
+
+def exec_bazel_file(filename, namespace):
+    if manifest is not None:
+        manifest.record_file(filename)
+    module_cache.record_files([os.path.realpath(filename)])
+    with tracing.span(filename, "eval", mode = static_build.EXEC):
+        exec(code_cache.load(filename), namespace)
+
+def load_bazel_file(filename, label = None):
+    """Returns the Module for the .bzl file filename.
+
+    The file is evaluated only the first time it is loaded, in the
+    context of the file loading it; later loads reuse its symbols.
+    """
+    filename = os.path.realpath(filename)
+    def evaluate():
         print("Reading file" + filename)
-        exec(f.read(), my_globs, GetDict(BuildFileFunctions(converter)))
+        module_globals = {"__builtins__": WORKSPACE_RULES.module_builtins()}
+        interpreter_curdir.append(os.path.dirname(filename))
+        try:
+            with rules.evaluating(rules.current_context(), module_globals,
+                                  rules.current_rule_set()):
+                exec_bazel_file(filename, module_globals)
+        finally:
+            interpreter_curdir.pop()
+        return module_globals
+    module = module_cache.get(filename, label or filename, evaluate)
+    if manifest is not None:
+        for f in module.files:
+            manifest.record_file(f)
+    return module
+
+def evaluate_package(converter, filename, evaluate):
+    """Runs evaluate() for the package defined by filename.
+
+    In incremental mode a package whose inputs are unchanged since the
+    last run is not evaluated; the output it produced then is appended
+    to converter instead.
+    """
+    if manifest is None:
+        evaluate()
+        return
+    package = os.path.abspath(filename)
+    record = manifest.lookup(package)
+    if record is not None:
+        print("Reusing " + package)
+        for proj_dir in converter.splice(record["fragments"]):
+            converter.add_subproject(load_subproject(proj_dir))
+        return
+    manifest.begin(package, converter)
+    ok = False
+    try:
+        evaluate()
+        ok = True
+    finally:
+        manifest.end(converter, ok)
+
+def load_build_file(converter, filename):
+    """Evaluates a BUILD file, without exec when it is purely declarative."""
+    context = BuildFileFunctions(converter)
+    namespace = BUILD_RULES.namespace(context)
+    records = static_build.parse_file(filename, BUILD_RULES.names)
+    with rules.evaluating(context, namespace, BUILD_RULES):
+        if records is None:
+            print("Reading file %s (%s)" % (filename, static_build.EXEC))
+            static_build.stats[static_build.EXEC] += 1
+            exec_bazel_file(filename, namespace)
+            return
+        print("Reading file %s (%s)" % (filename, static_build.STATIC))
+        static_build.stats[static_build.STATIC] += 1
+        if manifest is not None:
+            manifest.record_file(filename)
+        with tracing.span(filename, "eval", mode = static_build.STATIC):
+            static_build.apply(records, namespace)
+
+def load_package(converter, filename):
+    def evaluate():
+        interpreter_curdir.append(os.path.dirname(filename))
+        try:
+            load_build_file(converter, filename)
+        finally:
+            interpreter_curdir.pop()
+    evaluate_package(converter, filename, evaluate)
+
+def _declared_archive(kwargs):
+    """Tells whether the http_archive() kwargs is already declared by
+    another workspace, so it will not be fetched again."""
+    return repositories.known(kwargs["name"], repository_index.archive_identity(
+        fetch.archive_urls(kwargs), kwargs.get("sha256"),
+        kwargs.get("strip_prefix")))
+
+def load_workspace(converter, proj_dir):
+    workspace_file = os.path.join(proj_dir, "WORKSPACE")
+    if converter.deferred_repositories is None:
+        fetch.prefetch(workspace_file, proj_dir, skip = _declared_archive)
+    context = WorkspaceFileFunctions(converter)
+    namespace = WORKSPACE_RULES.namespace(context)
+    # Every repository is declared before any is loaded, so the
+    # declarations of this WORKSPACE take precedence over those of the
+    # subprojects it loads.
+    deferred = converter.deferred_repositories is None
+    if deferred:
+        converter.deferred_repositories = {}
+    interpreter_curdir.append(proj_dir)
+    try:
+        with rules.evaluating(context, namespace, WORKSPACE_RULES):
+            exec_bazel_file(workspace_file, namespace)
+    finally:
+        interpreter_curdir.pop()
+        if deferred:
+            loads = converter.deferred_repositories
+            converter.deferred_repositories = None
+    if deferred:
+        for load in loads.values():
+            load()
+
+def _counters():
+    return {
+        "code_cache": code_cache.code_cache().stats(),
+        "static_build": dict(static_build.stats),
+        "modules": module_cache.stats(),
+    }
+
+def _load_package_job(proj_dir, filename):
+    """Evaluates one package in a worker process.
+
+    Returns the text the package emitted, its incremental manifest
+    record (if any), and how much the worker's cache and front end
+    counters moved.
+    """
+    converter = Converter(proj_dir)
+    # Forget the spans inherited from the parent; it has them already.
+    tracing.take_events()
+    before = _counters()
+    hits = manifest.hits if manifest is not None else 0
+    load_package(converter, filename)
+    record = None
+    if manifest is not None:
+        record = (manifest.record(os.path.abspath(filename)),
+                  manifest.hits > hits)
+    after = _counters()
+    return (converter.fragments_since((0, 0, 0, 0, 0)), record,
+            {name: {k: after[name][k] - before[name][k] for k in after[name]}
+             for name in after}, tracing.take_events())
+
+def _preload_shared_files(proj_dir, build_files):
+    """Evaluates the .bzl files that the packages load before forking, so
+    the workers inherit them in the module cache."""
+    context = BuildFileFunctions(Converter(proj_dir))
+    namespace = BUILD_RULES.namespace(context)
+    with rules.evaluating(context, namespace, BUILD_RULES):
+        for filename in build_files:
+            interpreter_curdir.append(os.path.dirname(filename))
+            try:
+                for load_args in packages.static_loads(filename):
+                    if load_args[0].startswith(":") or load_args[0].startswith("//"):
+                        context.load(*load_args)
+            finally:
+                interpreter_curdir.pop()
+
+def load_packages(converter, proj_dir):
+    """Evaluates every package of the project at proj_dir into converter.
+
+    With more than one job the packages are evaluated in a pool of
+    forked worker processes, each with its own copy of the interpreter
+    state, and their output is merged back in package order.
+    """
+    build_files = [f for _, f in packages.find_packages(proj_dir)]
+    if jobs <= 1 or len(build_files) <= 1 or \
+            "fork" not in multiprocessing.get_all_start_methods():
+        for filename in build_files:
+            load_package(converter, filename)
+        return
 
-def load_subproject(proj_dir):
+    _preload_shared_files(proj_dir, build_files)
+    # Forked workers would otherwise print our buffered output again.
+    sys.stdout.flush()
+    context = multiprocessing.get_context("fork")
+    with concurrent.futures.ProcessPoolExecutor(jobs, mp_context = context) as pool:
+        results = list(pool.map(_load_package_job,
+                                [proj_dir] * len(build_files), build_files))
+    for filename, (fragments, record, counters, events) in zip(build_files, results):
+        converter.splice(fragments)
+        if record is not None:
+            manifest.adopt(os.path.abspath(filename), *record)
+        code_cache.code_cache().add_stats(counters["code_cache"])
+        module_cache.add_stats(counters["modules"])
+        tracing.add_events(events)
+        for k, v in counters["static_build"].items():
+            static_build.stats[k] += v
+
+def _expand_pattern(converter, proj_dir, pattern, evaluated):
+    """Evaluates the packages that pattern names and returns its targets.
+
+    Patterns are labels, //pkg:all (or //pkg:*) for every target of a
+    package, and //pkg/... for every target beneath pkg.
+    """
+    graph = converter.graph
+    if pattern.endswith("/..."):
+        prefix = pattern[2:-4].strip("/")
+        found = [rel for rel, _ in packages.find_packages(proj_dir)
+                 if not prefix or rel == prefix or rel.startswith(prefix + "/")]
+        for package in found:
+            _load_closure_package(converter, proj_dir, package, evaluated)
+        return [i for package in found for i in graph.by_package.get(package, [])]
+    if pattern.endswith(":all") or pattern.endswith(":*"):
+        package = pattern[2:pattern.rindex(":")]
+        _load_closure_package(converter, proj_dir, package, evaluated)
+        return list(graph.by_package.get(package, []))
+    label = graph.resolve(pattern, "")
+    _load_closure_package(converter, proj_dir, target_graph.package_of(label),
+                          evaluated)
+    assert label in graph.by_label, "No such target: " + pattern
+    return [graph.by_label[label]]
+
+def _load_closure_package(converter, proj_dir, package, evaluated):
+    """Evaluates package unless it is in evaluated already."""
+    if package in evaluated:
+        return
+    evaluated.add(package)
+    filename = packages.build_file(os.path.join(proj_dir, package))
+    if filename is not None:
+        load_package(converter, filename)
+
+def load_closure(converter, proj_dir, patterns):
+    """Evaluates only the packages needed by the targets patterns name.
+
+    Packages are evaluated as labels first resolve into them, and
+    repositories are fetched only once a label refers to them.  Only the
+    targets named and their transitive deps are emitted.
+    """
+    graph = converter.graph
+    evaluated = set()
+    roots = []
+    for pattern in patterns:
+        roots.extend(_expand_pattern(converter, proj_dir, pattern, evaluated))
+    seen = set(roots)
+    work = list(roots)
+    while work:
+        target = graph.targets[work.pop()]
+        for dep in target.deps:
+            label = graph.resolve(dep, target.package)
+            if label.startswith("@"):
+                repo = label[1:].split("//", 1)[0]
+                load = converter.deferred_repositories.pop(repo, None)
+                if load is not None:
+                    load()
+                    label = graph.resolve(dep, target.package)
+            if label not in graph.by_label and not label.startswith("@"):
+                _load_closure_package(converter, proj_dir,
+                                      target_graph.package_of(label), evaluated)
+            index = graph.by_label.get(label)
+            if index is not None and index not in seen:
+                seen.add(index)
+                work.append(index)
+    converter.roots = roots
+
+def load_subproject(proj_dir, patterns = None):
+    """Evaluates the project at proj_dir and returns its Converter.
+
+    Given target patterns, only what they need is evaluated and emitted.
+    """
     new_conv = Converter(proj_dir)
-    with open(os.path.join(proj_dir, "WORKSPACE"), "r") as f:
-        exec(f.read(), my_globs, GetDict(WorkspaceFileFunctions(converter)))
-    if os.path.exists(os.path.join(proj_dir, "BUILD")):
-        load_bazel_file(new_conv, os.path.join(proj_dir, "BUILD"))
-    elif os.path.exists(os.path.join(proj_dir, "BUILD.bazel")):
-        load_bazel_file(new_conv, os.path.join(proj_dir, "BUILD.bazel"))
+    if patterns:
+        new_conv.deferred_repositories = {}
+        # Fetches are deferred, so the WORKSPACE is cheap, and it must run
+        # to learn about the repositories.
+        load_workspace(new_conv, proj_dir)
+        load_closure(new_conv, proj_dir, patterns)
+        return new_conv
+    evaluate_package(new_conv, os.path.join(proj_dir, "WORKSPACE"),
+                     lambda: load_workspace(new_conv, proj_dir))
+    load_packages(new_conv, proj_dir)
     return new_conv
 
-load_subproject(os.curdir)
-#with open("WORKSPACE", "r") as workspace:
-#    exec(workspace.read(), GetDict(WorkspaceFileFunctions(converter)))
-#with open("BUILD", "r") as workspace:
-#    exec(build.read(), GetDict(BuildFileFunctions(converter)))
-
-with open(sys.argv[1], "w") as f:
-  f.write(converter.convert())
+class Options(object):
+    """How convert_workspace() converts a workspace; see main() for what
+    each option does."""
+
+    __slots__ = ("patterns", "incremental", "jobs", "split", "performance",
+                 "report_removed_deps", "profile", "repository_policy")
+
+    def __init__(self, patterns = (), incremental = False, jobs = 1,
+                 split = False, performance = False,
+                 report_removed_deps = False, profile = None,
+                 repository_policy = "first"):
+        self.patterns = list(patterns)
+        self.incremental = incremental
+        self.jobs = jobs
+        self.split = split
+        self.performance = performance
+        self.report_removed_deps = report_removed_deps
+        self.profile = profile
+        self.repository_policy = repository_policy
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(**{k: getattr(args, k) for k in cls.__slots__})
+
+    def replace(self, **changes):
+        """Returns a copy of these options with changes applied."""
+        values = {k: getattr(self, k) for k in self.__slots__}
+        values.update(changes)
+        return Options(**values)
+
+@contextlib.contextmanager
+def _session(path, output, options, incremental_state = False):
+    """Gives the conversion of the workspace at path its own module state.
+
+    The loading state, module cache, manifest, settings and profiler
+    state are module globals, which the rule handlers use; they are
+    replaced for the duration of the conversion and the caller's are
+    restored afterwards, so conversions can follow and even nest in one
+    process.  The download, git and bytecode caches are shared, but git
+    commits are pinned in the workspace's own pins file.
+    """
+    global interpreter_curdir, repositories, manifest, module_cache, \
+        jobs, performance, pins_file
+    saved = (interpreter_curdir, repositories, manifest, module_cache,
+             jobs, performance, pins_file, static_build.stats)
+    saved_tracing = tracing.save_state()
+    interpreter_curdir = [os.curdir]
+    repositories = repository_index.RepositoryIndex(options.repository_policy)
+    manifest = None
+    if options.incremental or incremental_state:
+        manifest = incremental.Manifest.for_output(output)
+    module_cache = modules.ModuleCache()
+    jobs = options.jobs
+    performance = options.performance
+    pins_file = os.path.join(os.path.abspath(path), git_mirror.PINS_FILE)
+    static_build.stats = dict.fromkeys(saved[-1], 0)
+    if not options.profile:
+        # An enclosing conversion may be profiling.
+        tracing.disable()
+    try:
+        yield
+    finally:
+        (interpreter_curdir, repositories, manifest, module_cache,
+         jobs, performance, pins_file, static_build.stats) = saved
+        tracing.restore_state(saved_tracing)
+
+def _convert(path, output, options):
+    """Converts the workspace at path in the current session.
+
+    Returns the paths of the files written or left up to date.
+    """
+    if options.profile:
+        tracing.enable()
+
+    converter = load_subproject(path, options.patterns)
+    report_missing_sources(converter)
+    report_unresolved_deps(converter)
+    if performance:
+        converter.add_prelude(converter.performance_settings)
+
+    print("Bytecode cache: %(hits)d hits, %(misses)d misses" %
+          code_cache.code_cache().stats())
+    print("BUILD files: %(static)d static, %(exec)d exec'd" % static_build.stats)
+    print(".bzl modules: %(hits)d hits, %(misses)d misses" % module_cache.stats())
+
+    if repositories.avoided or repositories.conflicts:
+        print(repositories.summary())
+
+    if manifest is not None:
+        # In watch mode the manifest is only saved on the way out.
+        if options.incremental:
+            manifest.save()
+        print("Incremental: %d packages reused, %d evaluated" % (
+            manifest.hits, manifest.misses))
+
+    paths = []
+    with tracing.span(output, "emit"):
+        if options.split:
+            outputs = converter.outputs(output)
+        else:
+            outputs = [(output, converter.chunks())]
+            if converter.subprojects:
+                print("%d subprojects are not emitted without --split" %
+                      len(converter.subprojects))
+        written = 0
+        for file_path, chunks in outputs:
+            paths.append(os.path.abspath(file_path))
+            if incremental.write_if_changed(file_path, chunks):
+                written += 1
+            elif not options.split:
+                print(output + " is up to date")
+        if options.split:
+            print("Wrote %d CMakeLists.txt files, the others are up to date" %
+                  written)
+
+    if options.report_removed_deps:
+        report_removed_deps(converter)
+
+    if options.profile:
+        tracing.write(options.profile)
+        print(tracing.summary(collections.Counter(
+            {kind: len(targets)
+             for kind, targets in converter.graph.by_kind.items()})))
+    return paths
+
+def convert_workspace(path, output = None, options = None):
+    """Converts the Bazel workspace at path to CMake.
+
+    output is the CMakeLists.txt to write, by default the one in path.
+    Each call has its own state, so any number of workspaces can be
+    converted in one process, one after another; they share the
+    download, git and bytecode caches.  Returns the paths of the files
+    written or left up to date.
+    """
+    if output is None:
+        output = os.path.join(path, "CMakeLists.txt")
+    if options is None:
+        options = Options()
+    # The tree may have changed since an earlier call listed it.
+    bazel_glob.clear_cache()
+    with _session(path, output, options):
+        return _convert(path, output, options)
+
+def _watched_dirs(proj_dir):
+    """Returns the directories whose changes can change the output: the
+    project's, those of every file read, and those glob() scanned."""
+    files, globbed = manifest.inputs()
+    dirs = set(watch.walk(proj_dir))
+    dirs.update(os.path.dirname(f) for f in files)
+    for directory in globbed:
+        if directory not in dirs:
+            dirs.update(watch.walk(directory))
+    return dirs
+
+def _relevant_changes(changed, outputs):
+    """Returns the paths in changed that can change the output.
+
+    Those are files read by the last run, and any file created, deleted
+    or renamed, since it can be a new package or match a glob().  Our
+    own outputs, and the temporary files they are written through, are
+    left out.
+    """
+    files, _ = manifest.inputs()
+    output_dirs = set(os.path.dirname(p) for p in outputs)
+    relevant = {}
+    for path, listed in changed.items():
+        name = os.path.basename(path)
+        if path in outputs or (os.path.dirname(path) in output_dirs and
+                               name.startswith("tmp") and name.endswith(".tmp")):
+            continue
+        if listed or path in files:
+            relevant[path] = listed
+    return relevant
+
+def watch_workspace(path, output = None, options = None):
+    """Converts, then converts again whenever an input changes, until
+    interrupted.
+
+    Everything evaluated stays in memory between runs: the listing
+    cache, the .bzl module cache and the manifest records.  After a
+    change only the packages that read a changed file, or globbed the
+    directory it is in, are evaluated again; the others are spliced
+    from their records without re-checking their inputs.
+    """
+    global jobs, repositories
+    if output is None:
+        output = os.path.join(path, "CMakeLists.txt")
+    if options is None:
+        options = Options()
+    bazel_glob.clear_cache()
+    with _session(path, output, options, incremental_state = True):
+        watcher = watch.watcher()
+        try:
+            outputs = _convert(path, output, options)
+            # Later runs evaluate a few packages at most, which is quicker
+            # than starting worker processes for them.
+            jobs = 1
+            while True:
+                dirs = _watched_dirs(path)
+                try:
+                    watcher.watch(dirs)
+                except OSError as e:
+                    # Most likely out of inotify watches.
+                    print("%s; polling for changes instead" % e)
+                    watcher.close()
+                    watcher = watch.PollingWatcher()
+                    watcher.watch(dirs)
+                print("Watching %d directories for changes" % len(dirs))
+                sys.stdout.flush()
+                while True:
+                    changed = watcher.wait()
+                    if changed is None:
+                        break
+                    changed = _relevant_changes(changed, outputs)
+                    if changed:
+                        break
+                start = time.perf_counter()
+                if changed is None:
+                    print("Lost track of changes; checking every package")
+                    bazel_glob.clear_cache()
+                    module_cache.invalidate_all()
+                else:
+                    for changed_path, listed in changed.items():
+                        if listed:
+                            bazel_glob.forget(os.path.dirname(changed_path))
+                            bazel_glob.forget(changed_path)
+                    module_cache.invalidate(changed)
+                manifest.rollover(changed)
+                repositories = repository_index.RepositoryIndex(
+                    repositories.policy)
+                outputs = _convert(path, output, options)
+                print("Regenerated in %.0f ms" % (
+                    (time.perf_counter() - start) * 1000))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+            manifest.save()
+
+def _read_workspace_list(list_file):
+    if list_file == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(list_file, "r") as f:
+            lines = f.read().splitlines()
+    return [l.strip() for l in lines
+            if l.strip() and not l.strip().startswith("#")]
+
+def convert_batch(workspaces, output, options):
+    """Converts every workspace in workspaces, writing output (a path
+    relative to each workspace) in each.
+
+    The profile, if any, is likewise written in each workspace.  A
+    workspace that fails to convert is reported and skipped.  Returns
+    the workspaces that failed.
+    """
+    failed = []
+    start = time.perf_counter()
+    for i, workspace in enumerate(workspaces):
+        print("[%d/%d] Converting %s" % (i + 1, len(workspaces), workspace))
+        workspace_options = options
+        if options.profile:
+            workspace_options = options.replace(
+                profile = os.path.join(workspace, options.profile))
+        try:
+            convert_workspace(workspace, os.path.join(workspace, output),
+                              workspace_options)
+        except Exception as e:
+            print("Failed to convert %s: %s: %s" % (
+                workspace, type(e).__name__, e))
+            failed.append(workspace)
+    print("Converted %d of %d workspaces in %.1f s" % (
+        len(workspaces) - len(failed), len(workspaces),
+        time.perf_counter() - start))
+    for workspace in failed:
+        print("  failed: " + workspace)
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = "Converts a Bazel workspace to CMakeLists.txt.")
+    parser.add_argument("output", help = "the CMakeLists.txt file to write; "
+                        "with --batch, its path within each workspace")
+    parser.add_argument("patterns", nargs = "*", metavar = "pattern",
+                        help = "only convert these targets and their deps, "
+                               "given as //pkg:name, //pkg:all or //pkg/...")
+    parser.add_argument("--incremental", action = "store_true",
+                        help = "only re-evaluate packages whose BUILD, .bzl or "
+                               "glob() inputs changed since the last run")
+    parser.add_argument("--watch", action = "store_true",
+                        help = "keep running, and regenerate the output "
+                               "whenever a BUILD, .bzl or globbed file changes "
+                               "(implies --incremental)")
+    parser.add_argument("--batch", metavar = "LIST",
+                        help = "convert every workspace listed in this file "
+                               "(one directory per line, - for stdin) "
+                               "in this one process")
+    parser.add_argument("-j", "--jobs", type = int, default = 1,
+                        help = "evaluate packages in this many processes")
+    parser.add_argument("--split", action = "store_true",
+                        help = "write a CMakeLists.txt into every package and "
+                               "subproject, included from output with "
+                               "add_subdirectory()")
+    parser.add_argument("--performance", action = "store_true",
+                        help = "emit unity builds, precompiled headers, a "
+                               "ccache/sccache launcher and a Ninja link pool")
+    parser.add_argument("--report-removed-deps", action = "store_true",
+                        help = "list the deps left out of target_link_libraries() "
+                               "because other deps already provide them")
+    parser.add_argument("--repository-policy",
+                        choices = repository_index.POLICIES, default = "first",
+                        help = "which declaration of a repository name wins "
+                               "when subprojects declare it differently")
+    parser.add_argument("--profile", metavar = "TRACE_JSON",
+                        help = "write a Chrome trace of the run to this file "
+                               "(with --batch, its path within each "
+                               "workspace) and print a summary of where the "
+                               "time went")
+    args = parser.parse_args()
+    options = Options.from_args(args)
+
+    if args.batch:
+        if args.patterns or args.watch:
+            parser.error("--batch takes no patterns and no --watch")
+        if convert_batch(_read_workspace_list(args.batch), args.output,
+                         options):
+            sys.exit(1)
+    elif args.watch:
+        # Terminating the daemon, as IDEs do, still saves the manifest.
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        watch_workspace(os.curdir, args.output, options)
+    else:
+        convert_workspace(os.curdir, args.output, options)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""Measures what --performance saves when building the generated CMake.
+
+Writes a sample workspace whose libraries all include one header that
+pulls in a good part of the C++ standard library, converts it with and
+without --performance, and configures and builds each result from
+scratch.  Unity builds and the precompiled header are what make the
+difference; the compiler cache is left out (see --launcher) so that the
+second build is not simply served from the cache.  Needs cmake and a
+C++ compiler.
+
+    $ python benchmarks/build_benchmark.py --packages 20 --sources 6
+"""
+
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+TOOL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                    "bazel_to_cmake.py")
+
+COMMON_H = """\
+#pragma once
+#include <algorithm>
+#include <functional>
+#include <map>
+#include <memory>
+#include <sstream>
+#include <string>
+#include <unordered_map>
+#include <vector>
+"""
+
+SOURCE = """\
+#include "common/common.h"
+
+std::string %(name)s(int n) {
+  std::map<std::string, std::vector<int>> m;
+  for (int i = 0; i < n; ++i) m[std::to_string(i %% 7)].push_back(i);
+  std::ostringstream out;
+  for (const auto& kv : m) out << kv.first << kv.second.size();
+  return out.str();
+}
+"""
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def generate(ws, packages, sources):
+    _write(os.path.join(ws, "WORKSPACE"), 'workspace(name = "build_bench")\n')
+    _write(os.path.join(ws, "BUILD"), "")
+    _write(os.path.join(ws, "common", "common.h"), COMMON_H)
+    _write(os.path.join(ws, "common", "common.cc"),
+           '#include "common/common.h"\nint common_anchor = 0;\n')
+    _write(os.path.join(ws, "common", "BUILD"),
+           'cc_library(\n    name = "common",\n    srcs = ["common.cc"],\n'
+           '    hdrs = ["common.h"],\n)\n')
+    for p in range(packages):
+        package = os.path.join(ws, "pkg%d" % p)
+        for s in range(sources):
+            _write(os.path.join(package, "s%d.cc" % s),
+                   SOURCE % {"name": "p%d_s%d" % (p, s)})
+        _write(os.path.join(package, "BUILD"),
+               'cc_library(\n    name = "pkg%d",\n    srcs = glob(["*.cc"]),\n'
+               '    copts = ["-O1"],\n    deps = ["//common"],\n)\n' % p)
+
+
+def build(ws, build_dir, flags, jobs, launcher):
+    env = dict(os.environ)
+    env["BAZEL_TO_CMAKE_CACHE_DIR"] = os.path.join(build_dir, "cache")
+    subprocess.check_call([sys.executable, TOOL, "CMakeLists.txt"] + flags,
+                          cwd = ws, env = env, stdout = subprocess.DEVNULL)
+    configure = ["cmake", "-S", ws, "-B", build_dir,
+                 "-DCMAKE_BUILD_TYPE=Release"]
+    if not launcher:
+        configure.append("-DBAZEL_TO_CMAKE_LAUNCHER=OFF")
+    start = time.perf_counter()
+    subprocess.check_call(configure, stdout = subprocess.DEVNULL)
+    configured = time.perf_counter()
+    subprocess.check_call(["cmake", "--build", build_dir, "-j", str(jobs)],
+                          stdout = subprocess.DEVNULL)
+    return configured - start, time.perf_counter() - configured
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--packages", type = int, default = 20)
+    parser.add_argument("--sources", type = int, default = 6,
+                        help = "sources per package")
+    parser.add_argument("-j", "--jobs", type = int,
+                        default = multiprocessing.cpu_count())
+    parser.add_argument("--launcher", action = "store_true",
+                        help = "let the generated CMake use ccache or sccache")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ws = os.path.join(tmp, "ws")
+        generate(ws, args.packages, args.sources)
+        results = []
+        # Each variant is converted right before it is built, since the
+        # build re-runs CMake when CMakeLists.txt changes.
+        for label, flags in (("plain", []), ("performance", ["--performance"])):
+            print("Building %s..." % label, file = sys.stderr)
+            results.append((label, build(ws, os.path.join(tmp, label), flags,
+                                         args.jobs, args.launcher)))
+
+    print("%d packages x %d sources, %d jobs" % (
+        args.packages, args.sources, args.jobs))
+    print("%-12s %12s %10s" % ("", "configure s", "build s"))
+    for label, (configure, compile_time) in results:
+        print("%-12s %12.2f %10.2f" % (label, configure, compile_time))
+    plain, fast = results[0][1][1], results[1][1][1]
+    print("Build speedup: %.2fx" % (plain / fast))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Measures the per-file cost of setting up the builtins namespace.
+
+Writes thousands of tiny BUILD files and execs each of them twice: once
+with a namespace built by reflecting over a fresh BuildFileFunctions
+(how every file used to be evaluated) and once with the prebuilt
+RuleSet.  The difference is the fixed overhead every BUILD file pays.
+
+    $ python benchmarks/builtins_benchmark.py --files 5000
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bazel_to_cmake
+import code_cache
+from converter import Converter
+
+TINY_BUILD = 'cc_library(name = "lib%d", srcs = ["lib%d.cc"])\n'
+
+
+def reflective_namespace(obj):
+    ret = {}
+    for k in dir(obj):
+        if not k.startswith("__"):
+            ret[k] = getattr(obj, k)
+    return ret
+
+
+def run(files, namespace_for):
+    converter = Converter(os.curdir)
+    start = time.perf_counter()
+    for filename in files:
+        code = code_cache.load(filename)
+        exec(code, {}, namespace_for(bazel_to_cmake.BuildFileFunctions(converter)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--files", type = int, default = 5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep the benchmark's bytecode out of the user's cache.
+        os.environ["BAZEL_TO_CMAKE_CACHE_DIR"] = os.path.join(tmp, "cache")
+        files = []
+        for i in range(args.files):
+            filename = os.path.join(tmp, "BUILD.%d" % i)
+            with open(filename, "w") as f:
+                f.write(TINY_BUILD % (i, i))
+            files.append(filename)
+        # Warm the bytecode cache so only namespace setup and exec differ.
+        for filename in files:
+            code_cache.load(filename)
+
+        reflective = run(files, reflective_namespace)
+        prebuilt = run(files, bazel_to_cmake.BUILD_RULES.namespace)
+
+    print("%d files" % args.files)
+    print("%-12s %10.3f s %10.2f us/file" % (
+        "reflective", reflective, reflective / args.files * 1e6))
+    print("%-12s %10.3f s %10.2f us/file" % (
+        "prebuilt", prebuilt, prebuilt / args.files * 1e6))
+
+
+if __name__ == "__main__":
+    main()
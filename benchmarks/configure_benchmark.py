@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""Measures how fast the generated CMake configures and generates.
+
+Converts each fixture workspace under benchmarks/fixtures (and, with
+--synthetic, a workspace written by monorepo.py) in a temporary copy,
+then runs CMake on the result in its own build directory: once cold,
+which includes detecting the compilers, then --repeat times warm, which
+re-reads every CMakeLists.txt and regenerates the build files.  The
+fastest warm run is what is compared.  Cases run in parallel, --jobs at
+a time.
+
+For each case it records the times, the size of the generated
+CMakeLists.txt files and the size of the build files CMake wrote
+(build.ninja and rules.ninja, or the Makefiles).  Given a --baseline it
+exits with status 1 if any case got slower or bigger than the baseline
+allows; --update-baseline rewrites the baseline instead.  Times are only
+compared against a baseline taken with the same CMake version and
+generator.
+
+    $ python benchmarks/configure_benchmark.py \\
+          --baseline benchmarks/configure_baseline.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TOOL = os.path.join(HERE, "..", "bazel_to_cmake.py")
+FIXTURES = os.path.join(HERE, "fixtures")
+sys.path.insert(0, HERE)
+
+import monorepo
+
+# (case name, fixture directory, bazel_to_cmake.py flags)
+CASES = [
+    ("basic", "basic", []),
+    ("basic-performance", "basic", ["--performance"]),
+    ("basic-split", "basic", ["--split"]),
+    ("subprojects-split", "subprojects", ["--split"]),
+]
+
+# Slower than the baseline by this fraction, plus the slack, fails.
+TIME_TOLERANCE = 0.25
+TIME_SLACK_S = 0.05
+# Generated files bigger than the baseline by this fraction fail.
+SIZE_TOLERANCE = 0.02
+
+_PHASE = re.compile(r"-- (Configuring|Generating) done \(([\d.]+)s\)")
+
+
+def _cmake_version():
+    output = subprocess.check_output(["cmake", "--version"])
+    return output.decode("utf-8").splitlines()[0].split()[-1]
+
+
+def _total_size(root, keep):
+    total = 0
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if keep(name):
+                total += os.path.getsize(os.path.join(directory, name))
+    return total
+
+
+def _is_build_file(name):
+    return name.endswith(".ninja") or name.startswith("Makefile") or \
+        name.endswith(".make")
+
+
+def _cmake(source_dir, build_dir, generator):
+    """Configures and generates once; returns the wall time and the
+    configure and generate times CMake reports (3.26 and later)."""
+    start = time.perf_counter()
+    output = subprocess.check_output(
+        ["cmake", "-S", source_dir, "-B", build_dir, "-G", generator,
+         "-Wno-dev", "-DBAZEL_TO_CMAKE_LAUNCHER=OFF"],
+        stderr = subprocess.STDOUT).decode("utf-8", "replace")
+    wall = time.perf_counter() - start
+    phases = dict((m.group(1).lower(), float(m.group(2)))
+                  for m in _PHASE.finditer(output))
+    return wall, phases.get("configuring"), phases.get("generating")
+
+
+def run_case(tmp, name, fixture, flags, generator, repeat, knobs = None):
+    case_dir = os.path.join(tmp, name)
+    if fixture is None:
+        ws, _ = monorepo.generate(case_dir, knobs)
+    else:
+        ws = os.path.join(case_dir, "ws")
+        shutil.copytree(os.path.join(FIXTURES, fixture), ws)
+    env = dict(os.environ)
+    env["BAZEL_TO_CMAKE_CACHE_DIR"] = os.path.join(case_dir, "cache")
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable, TOOL, "CMakeLists.txt"] + flags,
+                          cwd = ws, env = env, stdout = subprocess.DEVNULL)
+    convert = time.perf_counter() - start
+
+    build_dir = os.path.join(case_dir, "build")
+    cold, _, _ = _cmake(ws, build_dir, generator)
+    warm = [_cmake(ws, build_dir, generator) for _ in range(repeat)]
+    fastest = min(warm)
+    return {
+        "convert_s": convert,
+        "cold_s": cold,
+        "warm_s": fastest[0],
+        "configure_s": fastest[1],
+        "generate_s": fastest[2],
+        "cmakelists_bytes": _total_size(ws, lambda n: n == "CMakeLists.txt"),
+        "build_files_bytes": _total_size(build_dir, _is_build_file),
+    }
+
+
+def regressions(results, baseline, same_setup):
+    """Returns a message for every case worse than the baseline allows."""
+    found = []
+    for name, result in sorted(results.items()):
+        old = baseline.get("cases", {}).get(name)
+        if old is None:
+            continue
+        checks = [("cmakelists_bytes", SIZE_TOLERANCE, 0)]
+        if same_setup:
+            checks += [("build_files_bytes", SIZE_TOLERANCE, 0),
+                       ("warm_s", TIME_TOLERANCE, TIME_SLACK_S)]
+        for key, tolerance, slack in checks:
+            limit = old[key] * (1 + tolerance) + slack
+            if isinstance(old[key], int):
+                limit = int(limit)
+            if result[key] > limit:
+                found.append("%s: %s is %s, baseline %s (limit %s)" % (
+                    name, key, _format(result[key]), _format(old[key]),
+                    _format(limit)))
+    return found
+
+
+def _format(value):
+    if value is None:
+        return "n/a"
+    if isinstance(value, float):
+        return "%.3f" % value
+    return str(value)
+
+
+def print_results(results, baseline):
+    old_cases = baseline.get("cases", {}) if baseline else {}
+    print("%-22s %9s %8s %8s %9s %9s %11s %11s" % (
+        "case", "convert s", "cold s", "warm s", "config s", "generate s",
+        "CMake bytes", "build bytes"))
+    for name, r in sorted(results.items()):
+        line = "%-22s %9.3f %8.3f %8.3f %9s %9s %11d %11d" % (
+            name, r["convert_s"], r["cold_s"], r["warm_s"],
+            _format(r["configure_s"]), _format(r["generate_s"]),
+            r["cmakelists_bytes"], r["build_files_bytes"])
+        if name in old_cases:
+            line += "  (warm %+.1f%%)" % (
+                100.0 * (r["warm_s"] / old_cases[name]["warm_s"] - 1))
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("-G", "--generator", default = "Ninja")
+    parser.add_argument("-j", "--jobs", type = int,
+                        default = multiprocessing.cpu_count(),
+                        help = "cases to run at once")
+    parser.add_argument("--repeat", type = int, default = 3,
+                        help = "warm runs per case; the fastest counts")
+    parser.add_argument("--synthetic", type = int, default = 0,
+                        metavar = "PACKAGES",
+                        help = "also run a monorepo.py workspace of this "
+                               "many packages, converted with --split")
+    parser.add_argument("--baseline", help = "JSON file to compare against")
+    parser.add_argument("--update-baseline", action = "store_true",
+                        help = "write the results to --baseline instead")
+    args = parser.parse_args()
+
+    if shutil.which("cmake") is None:
+        parser.error("cmake is not installed")
+    if args.generator == "Ninja" and shutil.which("ninja") is None:
+        parser.error("ninja is not installed; pass -G 'Unix Makefiles' "
+                     "to use make instead")
+    if args.update_baseline and not args.baseline:
+        parser.error("--update-baseline needs --baseline")
+
+    cases = [(name, fixture, flags, None) for name, fixture, flags in CASES]
+    if args.synthetic:
+        knobs = monorepo.Knobs(packages = args.synthetic, local_repos = 2,
+                               http_archives = 0)
+        cases.append(("synthetic-%d-split" % args.synthetic, None,
+                      ["--split"], knobs))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, \
+            concurrent.futures.ThreadPoolExecutor(args.jobs) as pool:
+        futures = {pool.submit(run_case, tmp, name, fixture, flags,
+                               args.generator, args.repeat, knobs): name
+                   for name, fixture, flags, knobs in cases}
+        for future in concurrent.futures.as_completed(futures):
+            print("Finished %s" % futures[future], file = sys.stderr)
+            results[futures[future]] = future.result()
+
+    setup = {
+        "cmake": _cmake_version(),
+        "generator": args.generator,
+        "platform": platform.platform(),
+    }
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline) and \
+            not args.update_baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(dict(setup, cases = results), f, indent = 2,
+                      sort_keys = True)
+            f.write("\n")
+        print("Wrote " + args.baseline)
+        return
+    if baseline is None:
+        return
+    same_setup = all(baseline.get(k) == setup[k]
+                     for k in ("cmake", "generator"))
+    if not same_setup:
+        print("Baseline was taken with CMake %s and %s; only comparing "
+              "CMakeLists.txt sizes" % (baseline.get("cmake"),
+                                        baseline.get("generator")))
+    found = regressions(results, baseline, same_setup)
+    for message in found:
+        print("REGRESSION " + message)
+    if found:
+        sys.exit(1)
+    print("No regressions against " + args.baseline)
+
+
+if __name__ == "__main__":
+    main()
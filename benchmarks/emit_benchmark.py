@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""Measures how CMake emission scales with the number of targets.
+
+Adds n cc_library() targets to a Converter and streams chunks() to a
+file, for n from 1k to 200k.  That is the path a conversion takes: the
+topological order, the transitive reduction of every link line and the
+text of each target.  The targets are shaped like those of monorepo.py,
+--targets to a package, each depending on the one before it, plus a
+redundant dep on the one before that for the reduction to remove.  Time
+per target should stay nearly flat; it only creeps up as the reduction's
+reachability bitsets get longer along the chain.
+
+    $ python benchmarks/emit_benchmark.py
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Registers the cc_library() emitter.
+import bazel_to_cmake
+from converter import Converter
+import incremental
+from target_graph import Target
+
+SIZES = [1000, 10000, 20000, 50000, 100000, 200000]
+
+
+def make_targets(n, per_package):
+    """Yields n cc_library() targets, per_package to a package."""
+    for i in range(n):
+        p, t = divmod(i, per_package)
+        package = "pkg%d" % p
+        deps = []
+        if t:
+            deps.append(":t%d" % (t - 1))
+        elif p:
+            deps.append("//pkg%d:t%d" % (p - 1, per_package - 1))
+        if t >= 2:
+            # Already provided through t - 1, which passes its deps on.
+            deps.append(":t%d" % (t - 2))
+        yield Target("cc_library", package, "t%d" % t,
+                     srcs = ["%s/t%d.cc" % (package, t)],
+                     hdrs = ["%s/t%d.h" % (package, t)],
+                     deps = deps)
+
+
+def time_emitter(n, per_package, out):
+    start = time.perf_counter()
+    converter = Converter(os.curdir)
+    converter.add_prelude("project(bench)\n")
+    for target in make_targets(n, per_package):
+        converter.add_target(target)
+    incremental.write_if_changed(out, converter.chunks())
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--sizes", type = int, nargs = "+", default = SIZES)
+    parser.add_argument("--targets", type = int, default = 5,
+                        help = "targets per package")
+    args = parser.parse_args()
+
+    print("%10s %12s %14s" % ("targets", "emit (s)", "us/target"))
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "CMakeLists.txt")
+        for n in args.sizes:
+            if os.path.exists(out):
+                os.remove(out)
+            emit = time_emitter(n, args.targets, out)
+            print("%10d %12.3f %14.2f" % (n, emit, emit / n * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+#include "app.h"
+#include "core/core.h"
+#include "util/log.h"
+
+int app_main() { log_line("app"); return core_value(); }
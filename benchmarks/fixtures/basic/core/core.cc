@@ -0,0 +1,4 @@
+#include "core/core.h"
+#include "util/strings.h"
+
+int core_value() { return core_impl() + string_length("core"); }
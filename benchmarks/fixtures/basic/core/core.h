@@ -0,0 +1,4 @@
+#pragma once
+
+int core_value();
+int core_impl();
@@ -0,0 +1,3 @@
+#include "core/core.h"
+
+int core_impl() { return 1; }
@@ -0,0 +1,8 @@
+def checked_library(name, srcs, hdrs, deps = []):
+    cc_library(
+        name = name,
+        srcs = srcs,
+        hdrs = hdrs,
+        copts = ["-Wall"],
+        deps = deps,
+    )
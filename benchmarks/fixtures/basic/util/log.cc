@@ -0,0 +1,10 @@
+#include "util/log.h"
+
+#include <cstdio>
+
+#include "util/log.inc"
+#include "util/strings.h"
+
+void log_line(const char* line) {
+  std::printf(LOG_PREFIX "%s (%d)\n", line, string_length(line));
+}
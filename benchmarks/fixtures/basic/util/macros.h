@@ -0,0 +1,4 @@
+#pragma once
+
+#define UTIL_CONCAT_INNER(a, b) a##b
+#define UTIL_CONCAT(a, b) UTIL_CONCAT_INNER(a, b)
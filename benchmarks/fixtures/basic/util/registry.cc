@@ -0,0 +1,7 @@
+#include "util/registry.h"
+
+#include "util/macros.h"
+
+static int UTIL_CONCAT(registered_, total) = 1;
+
+int registered_count() { return registered_total; }
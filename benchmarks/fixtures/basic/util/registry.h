@@ -0,0 +1,3 @@
+#pragma once
+
+int registered_count();
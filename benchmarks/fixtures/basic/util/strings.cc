@@ -0,0 +1,7 @@
+#include "util/strings.h"
+
+int string_length(const char* s) {
+  int n = 0;
+  while (s[n]) ++n;
+  return n;
+}
@@ -0,0 +1,3 @@
+#pragma once
+
+int string_length(const char* s);
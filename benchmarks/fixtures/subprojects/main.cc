@@ -0,0 +1,3 @@
+#include "main.h"
+
+int main_value() { return 42; }
@@ -0,0 +1,3 @@
+#pragma once
+
+int main_value();
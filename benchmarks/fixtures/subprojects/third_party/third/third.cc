@@ -0,0 +1,3 @@
+#include "third.h"
+
+int third_value() { return 3; }
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+"""Writes synthetic Bazel workspaces for benchmarking.
+
+A workspace has --packages packages of --targets cc_library() targets
+each.  Every target globs its own directory of --fanout sources and
+depends on a target of the package before it, so the dependency graph
+is a long chain plus fan-in.  The first target of each package goes
+through a chain of --macro-depth .bzl macros, each loading the next.
+The root package also depends on --local-repos local_repository()
+subprojects and --http-archives http_archive() repositories, whose
+tarballs are served by a local HTTP server standing in for the real
+mirrors.
+
+    $ python benchmarks/monorepo.py /tmp/mono --packages 1000
+"""
+
+from __future__ import print_function
+
+import argparse
+import functools
+import hashlib
+import http.server
+import io
+import os
+import tarfile
+import threading
+
+
+class Knobs(object):
+    __slots__ = ("packages", "targets", "fanout", "macro_depth",
+                 "local_repos", "http_archives")
+
+    def __init__(self, packages = 100, targets = 5, fanout = 4,
+                 macro_depth = 3, local_repos = 2, http_archives = 2):
+        self.packages = packages
+        self.targets = targets
+        self.fanout = fanout
+        self.macro_depth = macro_depth
+        self.local_repos = local_repos
+        self.http_archives = http_archives
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def _write_macros(ws, depth):
+    _write(os.path.join(ws, "macros", "BUILD"), "")
+    _write(os.path.join(ws, "macros", "macro_0.bzl"),
+           "def macro_0(name, srcs, deps = []):\n"
+           "    cc_library(name = name, srcs = srcs, deps = deps)\n")
+    for level in range(1, depth + 1):
+        _write(os.path.join(ws, "macros", "macro_%d.bzl" % level),
+               'load("//macros:macro_%d.bzl", "macro_%d")\n\n'
+               "def macro_%d(name, srcs, deps = []):\n"
+               "    macro_%d(name = name, srcs = srcs, deps = deps)\n" % (
+                   level - 1, level - 1, level, level - 1))
+
+
+def _package_build(knobs, p):
+    lines = []
+    if knobs.macro_depth:
+        lines.append('load("//macros:macro_%d.bzl", "macro_%d")\n' % (
+            knobs.macro_depth, knobs.macro_depth))
+    for t in range(knobs.targets):
+        deps = []
+        if t:
+            deps.append(":p%d_t%d" % (p, t - 1))
+        elif p:
+            deps.append("//pkg%d:p%d_t%d" % (p - 1, p - 1, knobs.targets - 1))
+        rule = "macro_%d" % knobs.macro_depth if (t == 0 and knobs.macro_depth) \
+            else "cc_library"
+        lines.append('%s(\n    name = "p%d_t%d",\n    srcs = glob(["t%d/*.cc"]),\n'
+                     "    deps = %r,\n)\n" % (rule, p, t, t, deps))
+    return "\n".join(lines)
+
+
+def _archive(name):
+    """Returns a tarball of a repository with one library, and its sha256."""
+    data = io.BytesIO()
+    with tarfile.open(fileobj = data, mode = "w:gz") as tf:
+        for path, text in (
+                ("BUILD", 'cc_library(name = "%s", srcs = ["%s.cc"])\n' % (
+                    name, name)),
+                ("%s.cc" % name, "int %s() { return 0; }\n" % name)):
+            content = text.encode("utf-8")
+            info = tarfile.TarInfo("%s-1.0/%s" % (name, path))
+            info.size = len(content)
+            tf.addfile(info, io.BytesIO(content))
+    blob = data.getvalue()
+    return blob, hashlib.sha256(blob).hexdigest()
+
+
+def generate(root, knobs, archive_url = None):
+    """Writes a workspace to root/ws and its archives to root/archives.
+
+    archive_url is the base URL the archives will be served from.
+    Returns the workspace directory and the number of BUILD and .bzl
+    files written.
+    """
+    ws = os.path.join(root, "ws")
+    archives = os.path.join(root, "archives")
+    os.makedirs(archives, exist_ok = True)
+    files = 0
+
+    workspace = ['workspace(name = "synthetic")\n',
+                 'load("@bazel_tools//tools/build_defs/repo:http.bzl", '
+                 '"http_archive")\n']
+    root_deps = []
+    for i in range(knobs.local_repos):
+        name = "local%d" % i
+        repo = os.path.join(ws, "third_party", name)
+        _write(os.path.join(repo, "WORKSPACE"), 'workspace(name = "%s")\n' % name)
+        _write(os.path.join(repo, "BUILD"),
+               'cc_library(name = "%s", srcs = ["%s.cc"])\n' % (name, name))
+        _write(os.path.join(repo, name + ".cc"), "int %s() { return 0; }\n" % name)
+        workspace.append('local_repository(\n    name = "%s",\n'
+                         '    path = "third_party/%s",\n)\n' % (name, name))
+        files += 2
+    for i in range(knobs.http_archives):
+        name = "ext%d" % i
+        blob, sha256 = _archive(name)
+        with open(os.path.join(archives, name + ".tar.gz"), "wb") as f:
+            f.write(blob)
+        workspace.append('http_archive(\n    name = "%s",\n    urls = ["%s/%s.tar.gz"],\n'
+                         '    sha256 = "%s",\n    strip_prefix = "%s-1.0",\n)\n' % (
+                             name, archive_url, name, sha256, name))
+        root_deps.append("@%s//:%s" % (name, name))
+        files += 1
+    _write(os.path.join(ws, "WORKSPACE"), "\n".join(workspace))
+    files += 1
+
+    if knobs.macro_depth:
+        _write_macros(ws, knobs.macro_depth)
+        files += knobs.macro_depth + 2
+
+    for p in range(knobs.packages):
+        package = os.path.join(ws, "pkg%d" % p)
+        _write(os.path.join(package, "BUILD"), _package_build(knobs, p))
+        files += 1
+        for t in range(knobs.targets):
+            for s in range(knobs.fanout):
+                _write(os.path.join(package, "t%d" % t, "s%d.cc" % s),
+                       "int p%d_t%d_s%d() { return 0; }\n" % (p, t, s))
+
+    if knobs.packages:
+        root_deps.append("//pkg%d:p%d_t%d" % (
+            knobs.packages - 1, knobs.packages - 1, knobs.targets - 1))
+    _write(os.path.join(ws, "BUILD"),
+           'cc_library(\n    name = "root",\n    hdrs = ["root.h"],\n'
+           "    deps = %r,\n)\n" % root_deps)
+    _write(os.path.join(ws, "root.h"), "")
+    files += 1
+    return ws, files
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve(directory):
+    """Serves directory over HTTP on a free local port.
+
+    Returns the server, to be shut down by the caller, and its base URL.
+    """
+    server = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        functools.partial(_QuietHandler, directory = directory))
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, "http://127.0.0.1:%d" % server.server_address[1]
+
+
+def add_arguments(parser):
+    defaults = Knobs()
+    for knob, help in (
+            ("packages", "number of packages"),
+            ("targets", "cc_library() targets per package"),
+            ("fanout", "sources each target's glob() matches"),
+            ("macro_depth", "length of the chain of .bzl macros"),
+            ("local_repos", "number of local_repository() subprojects"),
+            ("http_archives", "number of http_archive() repositories")):
+        parser.add_argument("--" + knob.replace("_", "-"), type = int,
+                            default = getattr(defaults, knob), help = help)
+
+
+def knobs_from(args, **overrides):
+    values = {k: getattr(args, k) for k in Knobs.__slots__}
+    values.update(overrides)
+    return Knobs(**values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("root", help = "directory to write the workspace to")
+    parser.add_argument("--archive-url", default = "http://127.0.0.1:8000",
+                        help = "where the archives in root/archives will be "
+                               "served from")
+    add_arguments(parser)
+    args = parser.parse_args()
+    ws, files = generate(args.root, knobs_from(args), args.archive_url)
+    print("Wrote %d BUILD, .bzl and WORKSPACE files to %s" % (files, ws))
+
+
+if __name__ == "__main__":
+    main()
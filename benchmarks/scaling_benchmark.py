@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""Measures how a whole conversion scales with the size of the workspace.
+
+Generates a synthetic workspace (see monorepo.py) for each package count
+in --sizes, runs bazel_to_cmake.py over it with a cold cache and
+--profile, and reports wall time, peak RSS and files per second, plus
+the time spent evaluating .bzl files, in glob() and emitting CMake.
+Between consecutive sizes it prints the scaling exponent of each
+measure (1.0 is linear) and flags the super-linear ones.
+
+Results are written as JSON; pass an earlier results file to --compare
+to see the change against it.
+
+    $ python benchmarks/scaling_benchmark.py --sizes 100,1000,5000 \\
+          --json results.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TOOL = os.path.join(HERE, "..", "bazel_to_cmake.py")
+sys.path.insert(0, HERE)
+
+import monorepo
+
+# Exponents above this are reported as super-linear.
+SUPERLINEAR = 1.25
+
+
+def phase_times(trace_file):
+    """Sums the spans of the trace by phase, in seconds."""
+    with open(trace_file, "r") as f:
+        events = json.load(f)["traceEvents"]
+    phases = {"bzl_eval": 0.0, "build_eval": 0.0, "glob": 0.0, "emit": 0.0}
+    for event in events:
+        seconds = event["dur"] / 1e6
+        if event["cat"] == "eval":
+            phases["bzl_eval" if event["name"].endswith(".bzl")
+                   else "build_eval"] += seconds
+        elif event["cat"] in ("glob", "emit"):
+            phases[event["cat"]] += seconds
+    return phases
+
+
+def run_once(knobs, jobs):
+    with tempfile.TemporaryDirectory() as tmp:
+        server, url = monorepo.serve(os.path.join(tmp, "archives"))
+        try:
+            ws, files = monorepo.generate(tmp, knobs, url)
+            env = dict(os.environ)
+            env["BAZEL_TO_CMAKE_CACHE_DIR"] = os.path.join(tmp, "cache")
+            trace = os.path.join(tmp, "trace.json")
+            start = time.perf_counter()
+            process = subprocess.Popen(
+                [sys.executable, TOOL, "CMakeLists.txt", "--profile", trace,
+                 "--jobs", str(jobs)],
+                cwd = ws, env = env, stdout = subprocess.DEVNULL)
+            _, status, usage = os.wait4(process.pid, 0)
+            wall = time.perf_counter() - start
+            process.returncode = os.waitstatus_to_exitcode(status)
+            if process.returncode:
+                raise RuntimeError("conversion failed with status %d" %
+                                   process.returncode)
+            return {
+                "packages": knobs.packages,
+                "files": files,
+                "wall_s": wall,
+                # ru_maxrss is in kilobytes on Linux.
+                "peak_rss_bytes": usage.ru_maxrss * 1024,
+                "files_per_s": files / wall,
+                "phases_s": phase_times(trace),
+            }
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def exponent(a, b, key):
+    x0, x1 = a["packages"], b["packages"]
+    y0, y1 = key(a), key(b)
+    if x0 == x1 or y0 <= 0 or y1 <= 0:
+        return None
+    return math.log(y1 / y0) / math.log(x1 / x0)
+
+
+MEASURES = [
+    ("wall", lambda r: r["wall_s"]),
+    ("rss", lambda r: r["peak_rss_bytes"]),
+    ("bzl_eval", lambda r: r["phases_s"]["bzl_eval"]),
+    ("build_eval", lambda r: r["phases_s"]["build_eval"]),
+    ("glob", lambda r: r["phases_s"]["glob"]),
+    ("emit", lambda r: r["phases_s"]["emit"]),
+]
+
+
+def scaling(results):
+    rows = []
+    for a, b in zip(results, results[1:]):
+        row = {"from": a["packages"], "to": b["packages"]}
+        for name, key in MEASURES:
+            row[name] = exponent(a, b, key)
+        rows.append(row)
+    return rows
+
+
+def print_results(results, rows, previous = None):
+    old = {r["packages"]: r for r in (previous or {}).get("results", [])}
+    print("%9s %7s %9s %10s %9s %9s %9s %9s %9s" % (
+        "packages", "files", "wall s", "RSS MiB", "files/s",
+        "bzl s", "BUILD s", "glob s", "emit s"))
+    for r in results:
+        line = "%9d %7d %9.2f %10.1f %9.0f %9.3f %9.3f %9.3f %9.3f" % (
+            r["packages"], r["files"], r["wall_s"],
+            r["peak_rss_bytes"] / float(1 << 20), r["files_per_s"],
+            r["phases_s"]["bzl_eval"], r["phases_s"]["build_eval"],
+            r["phases_s"]["glob"], r["phases_s"]["emit"])
+        if r["packages"] in old:
+            line += "  (wall %+.1f%% vs. previous)" % (
+                100.0 * (r["wall_s"] / old[r["packages"]]["wall_s"] - 1))
+        print(line)
+    if rows:
+        print()
+        print("Scaling exponents (1.0 is linear):")
+        for row in rows:
+            cells = []
+            for name, _ in MEASURES:
+                value = row[name]
+                if value is None:
+                    cells.append("%s n/a" % name)
+                else:
+                    cells.append("%s %.2f%s" % (
+                        name, value, "!" if value > SUPERLINEAR else ""))
+            print("  %d -> %d: %s" % (row["from"], row["to"], ", ".join(cells)))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd = HERE,
+            stderr = subprocess.DEVNULL).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--sizes", default = "10,100,1000",
+                        help = "comma-separated package counts")
+    parser.add_argument("-j", "--jobs", type = int, default = 1)
+    parser.add_argument("--json", help = "write the results to this file")
+    parser.add_argument("--compare", help = "an earlier --json file")
+    monorepo.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = []
+    for size in sorted(int(s) for s in args.sizes.split(",")):
+        print("Converting %d packages..." % size, file = sys.stderr)
+        results.append(run_once(monorepo.knobs_from(args, packages = size),
+                                args.jobs))
+    rows = scaling(results)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            previous = json.load(f)
+    print_results(results, rows, previous)
+
+    if args.json:
+        knobs = monorepo.knobs_from(args).as_dict()
+        del knobs["packages"]
+        with open(args.json, "w") as f:
+            json.dump({
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "jobs": args.jobs,
+                "knobs": knobs,
+                "results": results,
+                "scaling": rows,
+            }, f, indent = 2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Shared on-disk caches for bazel_to_cmake.
+
+Everything lives under cache_root(), ~/.cache/bazel_to_cmake by default
+(or $BAZEL_TO_CMAKE_CACHE_DIR), so separate runs and separate checkouts
+share what was already fetched.
+"""
+
+import contextlib
+import hashlib
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on this platform; concurrent runs still never see
+    # partial entries thanks to the atomic rename.
+    fcntl = None
+
+DEFAULT_MAX_BYTES = 10 << 30
+
+
+def cache_root():
+    root = os.environ.get("BAZEL_TO_CMAKE_CACHE_DIR")
+    if not root:
+        root = os.path.join(
+            os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+            "bazel_to_cmake")
+    return root
+
+
+@contextlib.contextmanager
+def file_lock(path, shared = False):
+    """Holds an advisory lock on path for the duration: a shared one for
+    readers, or else an exclusive one."""
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _remove_unless_locked(lock_path, path):
+    """Removes path if nobody holds the lock at lock_path; returns
+    whether it was removed (or already gone)."""
+    with open(lock_path, "a") as f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    return True
+
+
+class DownloadCache(object):
+    """Content-addressed store of downloaded archives.
+
+    Entries are keyed by their sha256, or by a hash of the URL when the
+    WORKSPACE gives none.  Writers stream into a temporary file and
+    rename it into place, so readers never observe a partial entry.  A
+    hit refreshes the entry's mtime, and evict() removes the least
+    recently used entries until the store fits in max_bytes.
+
+    Readers of an entry hold lock(key, shared = True) while they use it
+    and writers hold lock(key); evict() skips entries that are locked
+    either way, so it never removes one from under another process.
+    """
+
+    def __init__(self, root = None, max_bytes = None):
+        if root is None:
+            root = os.path.join(cache_root(), "cas")
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("BAZEL_TO_CMAKE_CACHE_MAX_BYTES",
+                                           DEFAULT_MAX_BYTES))
+        self.root = root
+        self.max_bytes = max_bytes
+        self._locks = os.path.join(root, "locks")
+        self._tmp = os.path.join(root, "tmp")
+        os.makedirs(self._locks, exist_ok = True)
+        os.makedirs(self._tmp, exist_ok = True)
+
+    @staticmethod
+    def key(sha256 = None, url = None):
+        if sha256:
+            return sha256.lower()
+        return "url-" + hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key[-2:], key)
+
+    def get(self, key):
+        """Returns the path of the entry for key, or None on a miss."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _lock_path(self, key):
+        return os.path.join(self._locks, key + ".lock")
+
+    def lock(self, key, shared = False):
+        """Serializes writers of key, and keeps readers of key (shared)
+        and evict() apart, across threads and processes."""
+        return file_lock(self._lock_path(key), shared)
+
+    def temp_file(self):
+        """Returns (file object, path) of a fresh file on the cache's volume."""
+        fd, path = tempfile.mkstemp(dir = self._tmp, suffix = ".part")
+        return os.fdopen(fd, "wb"), path
+
+    def insert(self, key, temp_path):
+        """Atomically moves a completed temp_file() into the store."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        os.replace(temp_path, path)
+        return path
+
+    def evict(self, keep = ()):
+        """Drops least recently used entries until under max_bytes.
+
+        The entries of keep, such as the one just added, and those in
+        use are left alone, even if that leaves the store too big.
+        """
+        keep = set(self.path(key) for key in keep)
+        with file_lock(os.path.join(self._locks, "evict.lock")):
+            entries = []
+            total = 0
+            for shard in os.scandir(self.root):
+                if len(shard.name) != 2 or not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path in keep:
+                    continue
+                if _remove_unless_locked(
+                        self._lock_path(os.path.basename(path)), path):
+                    total -= size
@@ -0,0 +1,102 @@
+"""Persistent cache of compiled BUILD, WORKSPACE and .bzl code objects.
+
+Every evaluated file is compiled once and the marshalled code object is
+stored under cache_root()/bytecode, keyed by the interpreter's bytecode
+magic number, the file name and a hash of the source.  Later loads, in
+this run or any other, unmarshal it instead of compiling again.
+"""
+
+import hashlib
+import importlib.util
+import marshal
+import os
+import tempfile
+import threading
+
+import cache
+
+_code_cache = None
+_code_cache_lock = threading.Lock()
+
+
+class CodeCache(object):
+    def __init__(self, root = None):
+        if root is None:
+            root = os.path.join(cache.cache_root(), "bytecode")
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok = True)
+
+    @staticmethod
+    def key(source, filename):
+        digest = hashlib.sha256(importlib.util.MAGIC_NUMBER)
+        digest.update(filename.encode("utf-8") + b"\0")
+        digest.update(source)
+        return digest.hexdigest()
+
+    def compile(self, source, filename):
+        """Returns the code object for source, compiling only on a miss."""
+        key = self.key(source, filename)
+        with self._lock:
+            code = self._memory.get(key)
+        if code is None:
+            code = self._read(key)
+        if code is None:
+            code = compile(source, filename, "exec", dont_inherit = True)
+            self._write(key, code)
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.hits += 1
+        with self._lock:
+            self._memory[key] = code
+        return code
+
+    def _path(self, key):
+        return os.path.join(self.root, key[-2:], key)
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def _write(self, key, code):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        fd, tmp = tempfile.mkstemp(dir = os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            marshal.dump(code, f)
+        os.replace(tmp, path)
+
+    def load(self, filename):
+        """Returns the code object for the file at filename."""
+        with open(filename, "rb") as f:
+            return self.compile(f.read(), filename)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def add_stats(self, stats):
+        """Folds in the counters of a cache used by another process."""
+        with self._lock:
+            self.hits += stats["hits"]
+            self.misses += stats["misses"]
+
+
+def code_cache():
+    """Returns the process-wide CodeCache, creating it on first use."""
+    global _code_cache
+    with _code_cache_lock:
+        if _code_cache is None:
+            _code_cache = CodeCache()
+        return _code_cache
+
+
+def load(filename):
+    return code_cache().load(filename)
@@ -1,21 +1,219 @@
+import itertools
+import os
+import re
 import textwrap
 
+from target_graph import Target, TargetGraph
+
+_emitters = {}
+
+def register_emitter(kind, emit):
+    """Makes emit(graph, index, source_dir) generate the CMake text for
+    targets of kind.  source_dir is the directory, relative to the
+    project, of the CMakeLists.txt the text goes into."""
+    _emitters[kind] = emit
+
+def _add_subdirectory(from_dir, to_dir):
+    rel = os.path.relpath(to_dir, from_dir)
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        # Outside the source tree, so CMake needs a binary directory too.
+        return "add_subdirectory(%s external/%s)\n" % (
+            os.path.abspath(to_dir).replace(os.sep, "/"),
+            os.path.basename(os.path.abspath(to_dir)))
+    return "add_subdirectory(%s)\n" % rel.replace(os.sep, "/")
+
 class Converter(object):
+    """Collects the generated CMake for one project.
+
+    Rule handlers append text with add_prelude() and add_toplevel(), and
+    record targets with add_target().  Fragments are only ever appended
+    to lists, never concatenated, so emitting n targets costs O(n);
+    chunks() then streams the template with the fragments spliced in, in
+    the order they were added, followed by the text of every target in
+    topological order.
+    """
+
     def __init__(self, proj_dir):
-        self.prelude = ""
-        self.toplevel = ""
+        self._prelude = []
+        self._toplevel = []
+        self.graph = TargetGraph()
+        self._repositories = []
+        # Maps repository names to functions that fetch and load them, when
+        # loading repositories is deferred until a label refers to them.
+        self.deferred_repositories = None
+        # Indices of the targets to emit, with their deps; None for all.
+        self.roots = None
         self.if_lua = ""
         self._subprojects = []
         self._proj_dir = proj_dir
 
+    @property
+    def proj_dir(self):
+        return self._proj_dir
+
+    @property
+    def subprojects(self):
+        return self._subprojects
+
     def add_subproject(self, new_proj):
         self._subprojects.append(new_proj)
 
+    def add_prelude(self, text):
+        self._prelude.append(text)
+
+    def add_toplevel(self, text):
+        self._toplevel.append(text)
+
+    def add_target(self, target):
+        return self.graph.add(target)
+
+    def map_repository(self, name, package, external = False):
+        """Makes labels in repository name refer to the targets of package,
+        in this project or, if external, in the one defining name."""
+        self._repositories.append((name, package, external))
+        self.graph.add_repository(name, package, external)
+
+    def add_repository(self, name, load):
+        """Calls load() to load repository name now, or once it is needed."""
+        if self.deferred_repositories is None:
+            load()
+        else:
+            self.deferred_repositories[name] = load
+
+    def mark(self):
+        """Returns a position that fragments_since() can slice from."""
+        return (len(self._prelude), len(self._toplevel), len(self.graph),
+                len(self._repositories), len(self._subprojects))
+
+    def fragments_since(self, mark):
+        """Returns the (prelude, toplevel, targets, repositories,
+        subprojects) added after mark.
+
+        Targets are given by their state and subprojects by their
+        directory, which survive pickling and JSON.
+        """
+        return ("".join(self._prelude[mark[0]:]),
+                "".join(self._toplevel[mark[1]:]),
+                [t.__getstate__() for t in self.graph.targets[mark[2]:]],
+                self._repositories[mark[3]:],
+                [s.proj_dir for s in self._subprojects[mark[4]:]])
+
+    def splice(self, fragments):
+        """Adds what fragments_since() returned, possibly in another process.
+
+        Returns the directories of the subprojects, which the caller
+        has to load and add itself.
+        """
+        prelude, toplevel, targets, repositories, subprojects = fragments
+        self.add_prelude(prelude)
+        self.add_toplevel(toplevel)
+        for state in targets:
+            self.add_target(Target.from_state(state))
+        for name, package, external in repositories:
+            self.map_repository(name, package, external)
+        return subprojects
+
+    def _targets(self, indices, source_dir):
+        for index in indices:
+            yield _emitters[self.graph.targets[index].kind](
+                self.graph, index, source_dir)
+
+    def _render(self, prelude, toplevel):
+        for literal, section in self._template_parts():
+            yield literal
+            if section == "prelude":
+                for fragment in prelude:
+                    yield fragment
+            elif section == "toplevel":
+                for fragment in toplevel:
+                    yield fragment
+
+    def chunks(self):
+        """Yields the generated CMakeLists.txt piece by piece."""
+        return self._render(self._prelude, itertools.chain(
+            self._toplevel,
+            self._targets(self.graph.topological_order(self.roots), "")))
+
+    def outputs(self, root_file):
+        """Yields (path, chunks) for every file of the split output.
+
+        Each package with targets gets a CMakeLists.txt in its directory,
+        and each subproject its own tree.  root_file gets the template,
+        the root package's targets and an add_subdirectory() for each of
+        the others; it comes last, after the files it refers to.
+        """
+        root_dir = os.path.dirname(os.path.abspath(root_file))
+        by_package = {}
+        for index in self.graph.topological_order(self.roots):
+            by_package.setdefault(self.graph.targets[index].package,
+                                  []).append(index)
+
+        subdirectories = []
+        for package in sorted(by_package):
+            if package == "":
+                continue
+            package_dir = os.path.join(self._proj_dir, package)
+            subdirectories.append(_add_subdirectory(root_dir, package_dir))
+            yield (os.path.join(package_dir, "CMakeLists.txt"),
+                   itertools.chain([self.package_header],
+                                   self._targets(by_package[package], package)))
+        for subproject in self._subprojects:
+            subdirectories.append(
+                _add_subdirectory(root_dir, subproject.proj_dir))
+            for output in subproject.outputs(
+                    os.path.join(subproject.proj_dir, "CMakeLists.txt")):
+                yield output
+
+        root_package = os.path.relpath(root_dir, os.path.abspath(self._proj_dir))
+        yield root_file, self._render(self._prelude, itertools.chain(
+            self._toplevel,
+            self._targets(by_package.get("", []),
+                          "" if root_package == os.curdir else root_package),
+            subdirectories))
+
     def convert(self):
-        return self.template % {
-            "prelude": converter.prelude,
-            "toplevel": converter.toplevel,
-        }
+        return "".join(self.chunks())
+
+    @classmethod
+    def _template_parts(cls):
+        """Splits template into (literal, section name) pairs."""
+        parts = cls.__dict__.get("_parts")
+        if parts is None:
+            parts = []
+            pos = 0
+            for m in re.finditer(r"%\((\w+)\)s", cls.template):
+                parts.append((cls.template[pos:m.start()], m.group(1)))
+                pos = m.end()
+            parts.append((cls.template[pos:], None))
+            cls._parts = parts
+        return parts
+
+    # Added to the prelude of the root CMakeLists.txt by --performance.
+    performance_settings = textwrap.dedent("""\
+        # Build performance settings.  Configure with
+        # -DBAZEL_TO_CMAKE_LAUNCHER=OFF to build without a compiler cache.
+        find_program(BAZEL_TO_CMAKE_LAUNCHER NAMES sccache ccache)
+        if(BAZEL_TO_CMAKE_LAUNCHER AND NOT CMAKE_CXX_COMPILER_LAUNCHER)
+          set(CMAKE_C_COMPILER_LAUNCHER ${BAZEL_TO_CMAKE_LAUNCHER})
+          set(CMAKE_CXX_COMPILER_LAUNCHER ${BAZEL_TO_CMAKE_LAUNCHER})
+        endif()
+
+        # Links use far more memory than compiles; give them their own
+        # Ninja pool, one job per 2 GiB of RAM.
+        if(CMAKE_GENERATOR MATCHES "Ninja")
+          cmake_host_system_information(RESULT BAZEL_TO_CMAKE_RAM_MB
+                                        QUERY TOTAL_PHYSICAL_MEMORY)
+          math(EXPR BAZEL_TO_CMAKE_LINK_JOBS "${BAZEL_TO_CMAKE_RAM_MB} / 2048")
+          if(BAZEL_TO_CMAKE_LINK_JOBS LESS 1)
+            set(BAZEL_TO_CMAKE_LINK_JOBS 1)
+          endif()
+          set_property(GLOBAL APPEND PROPERTY JOB_POOLS
+                       link_pool=${BAZEL_TO_CMAKE_LINK_JOBS})
+          set(CMAKE_JOB_POOL_LINK link_pool)
+        endif()
+        """)
+
+    package_header = "# This file was generated from BUILD by bazel_to_cmake.py.\n\n"
 
     template = textwrap.dedent("""\
         # This file was generated from BUILD using tools/make_cmakelists.py.
@@ -78,6 +276,15 @@ class Converter(object):
 
         enable_testing()
 
+        # Users of alwayslink libraries link every object in them.
+        if(CMAKE_VERSION VERSION_LESS 3.24)
+          set(BAZEL_TO_CMAKE_WHOLE_ARCHIVE_BEGIN "-Wl,--whole-archive;")
+          set(BAZEL_TO_CMAKE_WHOLE_ARCHIVE_END ";-Wl,--no-whole-archive")
+        else()
+          set(BAZEL_TO_CMAKE_WHOLE_ARCHIVE_BEGIN "$<LINK_LIBRARY:WHOLE_ARCHIVE,")
+          set(BAZEL_TO_CMAKE_WHOLE_ARCHIVE_END ">")
+        endif()
+
         %(toplevel)s
 
         """)
@@ -0,0 +1,558 @@
+"""Concurrent fetching of http_archive repositories.
+
+Evaluating a WORKSPACE downloads each http_archive() in turn, so the
+fetches are collected up front from the WORKSPACE source and run in a
+thread pool over one pooled HTTP session.  Mirrors of the same archive
+are raced against each other and the first to respond wins.
+Evaluation then finds the archives already extracted on disk.
+
+Tar archives are extracted straight from the HTTP response, in one pass
+that also hashes the archive and copies it into the shared
+cache.DownloadCache, so an archive seen by any earlier run is extracted
+without touching the network.  Only the members under strip_prefix are
+written, with the prefix removed, and members that would land outside
+the destination, directly or through symlinks the archive made, are
+refused.
+"""
+
+import ast
+import concurrent.futures
+import hashlib
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+
+import requests
+
+try:
+    import zstandard
+except ImportError:
+    # .tar.zst archives cannot be extracted without it.
+    zstandard = None
+
+import cache
+import tracing
+
+MAX_PARALLEL_FETCHES = 8
+CHUNK_SIZE = 1 << 20
+TIMEOUT = 60
+
+_session = None
+_download_cache = None
+_session_lock = threading.Lock()
+
+
+class FetchError(Exception):
+    pass
+
+
+def session():
+    """Returns the process-wide HTTP session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections = MAX_PARALLEL_FETCHES,
+                pool_maxsize = MAX_PARALLEL_FETCHES * 4)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def archive_urls(kwargs):
+    urls = kwargs.get("urls")
+    if urls is None:
+        # handle the case when there is only one URL, make a list of 1
+        urls = [kwargs.get("url")]
+    return [u for u in urls if u]
+
+
+def download_cache():
+    """Returns the process-wide DownloadCache, creating it on first use."""
+    global _download_cache
+    with _session_lock:
+        if _download_cache is None:
+            _download_cache = cache.DownloadCache()
+        return _download_cache
+
+
+def archive_name(url, archive_type = None):
+    """Returns the name archive_format() reads the format of: the type
+    attribute of http_archive(), which has no leading dot ("zip",
+    "tar.gz"), if given, or else the last segment of url's path."""
+    if archive_type:
+        return "." + archive_type.lstrip(".")
+    return url.split("?")[0].split("#")[0].rstrip("/").split("/")[-1]
+
+
+def archive_format(archive_name):
+    """Returns how to unpack archive_name: "zip", or the tarfile
+    compression ("gz", "xz", "bz2", "zst" or "" for none)."""
+    name = archive_name.lower()
+    for suffixes, fmt in (((".tar.gz", ".tgz"), "gz"),
+                          ((".tar.xz", ".txz"), "xz"),
+                          ((".tar.bz2", ".tbz2", ".tbz"), "bz2"),
+                          ((".tar.zst", ".tzst"), "zst"),
+                          ((".tar",), ""),
+                          ((".zip", ".jar"), "zip")):
+        if name.endswith(suffixes):
+            return fmt
+    raise FetchError("Unknown file archive format: " + archive_name)
+
+
+def _member_path(name, strip_prefix):
+    """Returns where archive member name goes, relative to the destination.
+
+    Returns None for members outside strip_prefix and for the prefix
+    directory itself.  Raises FetchError for names that would escape
+    the destination.
+    """
+    path = posixpath.normpath(name.replace("\\", "/"))
+    if posixpath.isabs(path) or path == ".." or path.startswith("../"):
+        raise FetchError("Refusing to extract %s: outside the destination" % name)
+    if strip_prefix:
+        if not path.startswith(strip_prefix + "/"):
+            return None
+        path = path[len(strip_prefix) + 1:]
+    if path in ("", "."):
+        return None
+    return path
+
+
+def _inside(dest_dir, path):
+    """Tells whether path is dest_dir or beneath it, once every symlink
+    on the way (including those the archive created) is resolved.
+    dest_dir must already be a real path."""
+    path = os.path.realpath(path)
+    return path == dest_dir or path.startswith(dest_dir + os.sep)
+
+
+def _check_inside(dest_dir, path, member):
+    if not _inside(dest_dir, path):
+        raise FetchError("Refusing to extract %s: outside the destination"
+                         % member.name)
+
+
+def _extract_member(tf, member, path, dest_dir, strip_prefix, checked):
+    """Writes member to path under dest_dir, a real path.
+
+    Earlier members may have made symlinks, so where each member really
+    lands is checked just before it is written.  checked holds the
+    directories already known to be inside dest_dir; it is emptied
+    whenever a symlink is made, since that can move them.
+    """
+    target = os.path.join(dest_dir, *path.split("/"))
+    if member.isdir():
+        _check_inside(dest_dir, target, member)
+        os.makedirs(target, exist_ok = True)
+        return
+    parent = os.path.dirname(target)
+    if parent not in checked:
+        _check_inside(dest_dir, parent, member)
+        os.makedirs(parent, exist_ok = True)
+        checked.add(parent)
+    if member.issym():
+        link = os.path.join(parent, member.linkname)
+        if os.path.isabs(member.linkname):
+            raise FetchError("Refusing to extract %s: absolute link"
+                             % member.name)
+        _check_inside(dest_dir, link, member)
+        os.symlink(member.linkname, target)
+        checked.clear()
+        return
+    # Never write through a link that an earlier member left at target.
+    if os.path.islink(target):
+        os.remove(target)
+    if member.islnk():
+        source = _member_path(member.linkname, strip_prefix)
+        if source is None:
+            raise FetchError("Refusing to extract %s: link outside "
+                             "strip_prefix" % member.name)
+        source = os.path.join(dest_dir, *source.split("/"))
+        _check_inside(dest_dir, source, member)
+        os.link(source, target)
+    elif member.isfile():
+        with tf.extractfile(member) as src, open(target, "wb") as out:
+            shutil.copyfileobj(src, out, CHUNK_SIZE)
+        # Keep the executable bits, but always leave files writable.
+        os.chmod(target, (member.mode & 0o777) | 0o600)
+    # Devices and fifos are never needed to build.
+
+
+def _extract_tar(fileobj, fmt, dest_dir, strip_prefix):
+    if fmt == "zst":
+        if zstandard is None:
+            raise FetchError(".tar.zst archives need the zstandard module")
+        fileobj = zstandard.ZstdDecompressor().stream_reader(fileobj)
+        fmt = ""
+    dest_dir = os.path.realpath(dest_dir)
+    # Stream mode reads the archive front to back exactly once.
+    checked = set()
+    with tarfile.open(fileobj = fileobj, mode = "r|" + fmt) as tf:
+        for member in tf:
+            path = _member_path(member.name, strip_prefix)
+            if path is not None:
+                _extract_member(tf, member, path, dest_dir, strip_prefix,
+                                checked)
+
+
+def _extract_zip(filename, dest_dir, strip_prefix):
+    with zipfile.ZipFile(filename, "r") as zf:
+        for info in zf.infolist():
+            path = _member_path(info.filename, strip_prefix)
+            if path is None:
+                continue
+            target = os.path.join(dest_dir, *path.split("/"))
+            if info.is_dir():
+                os.makedirs(target, exist_ok = True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok = True)
+            with zf.open(info) as src, open(target, "wb") as out:
+                shutil.copyfileobj(src, out, CHUNK_SIZE)
+
+
+def extract_archive(filename, dest_dir, archive_name = None, strip_prefix = None):
+    """Extracts the members of filename under strip_prefix into dest_dir,
+    with the prefix removed.
+
+    The format is chosen from archive_name, which defaults to filename;
+    cache entries carry no extension of their own.
+    """
+    archive_name = archive_name or filename
+    fmt = archive_format(archive_name)
+    strip_prefix = (strip_prefix or "").strip("/")
+    with tracing.span(archive_name, "extract", dest = dest_dir):
+        if fmt == "zip":
+            _extract_zip(filename, dest_dir, strip_prefix)
+        else:
+            print("Extracting tar")
+            with open(filename, "rb") as f:
+                _extract_tar(f, fmt, dest_dir, strip_prefix)
+
+
+class _Tee(object):
+    """Reads a response, hashing it and copying it to a file as it goes."""
+
+    def __init__(self, raw, out):
+        self._raw = raw
+        self._out = out
+        self.digest = hashlib.sha256()
+
+    def read(self, size = -1):
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(CHUNK_SIZE), b""))
+        data = self._raw.read(size)
+        self.digest.update(data)
+        self._out.write(data)
+        return data
+
+    def drain(self):
+        """Reads what the extractor left, such as the tar padding."""
+        while self.read(CHUNK_SIZE):
+            pass
+
+
+def _download(url, cancelled):
+    """Streams url into a cache temp file, hashing it on the way.
+
+    Returns (temp path, sha256 hex digest), or None if another mirror won
+    first.
+    """
+    f, out = download_cache().temp_file()
+    digest = hashlib.sha256()
+    try:
+        with tracing.span(url, "fetch"), f, \
+                session().get(url, stream = True, timeout = TIMEOUT) as r:
+            r.raise_for_status()
+            for chunk in r.iter_content(CHUNK_SIZE):
+                if cancelled.is_set():
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+        if not cancelled.is_set():
+            return out, digest.hexdigest()
+    except BaseException:
+        os.remove(out)
+        raise
+    os.remove(out)
+    return None
+
+
+def _discard_download(future):
+    if not future.cancelled() and future.exception() is None:
+        result = future.result()
+        if result is not None:
+            os.remove(result[0])
+
+
+def _race(name, urls, sha256):
+    """Downloads all mirrors at once and returns the first good one.
+
+    Returns (url, temp path).  Mirrors whose content does not match
+    sha256 are discarded.  Raises FetchError when every mirror fails.
+    """
+    cancelled = threading.Event()
+    pool = concurrent.futures.ThreadPoolExecutor(max(len(urls), 1))
+    futures = {pool.submit(_download, url, cancelled): url for url in urls}
+
+    winner = None
+    errors = []
+    pending = set(futures)
+    for future in concurrent.futures.as_completed(futures):
+        url = futures[future]
+        pending.discard(future)
+        try:
+            result = future.result()
+        except Exception as e:
+            errors.append("%s: %s" % (url, e))
+            continue
+        if result is None:
+            continue
+        out, digest = result
+        if sha256 and digest != sha256.lower():
+            os.remove(out)
+            errors.append("%s: sha256 mismatch, expected %s but got %s" % (
+                url, sha256, digest))
+            continue
+        winner = url, out
+        cancelled.set()
+        for other in pending:
+            other.add_done_callback(_discard_download)
+        break
+    # Losing mirrors notice the cancellation and clean up after themselves;
+    # those that finished first anyway are removed by _discard_download.
+    pool.shutdown(wait = False)
+
+    if winner is None:
+        raise FetchError("Failed to fetch %s:\n  %s" % (
+            name, "\n  ".join(errors)))
+    return winner
+
+
+def _cache_key(store, urls, sha256):
+    """Returns the key an archive is stored under: its sha256, or else
+    its first URL, whichever mirror it came from."""
+    return store.key(sha256 = sha256, url = None if sha256 else urls[0])
+
+
+def download(name, urls, sha256 = None):
+    """Returns (url, path) of a verified copy of the archive in the cache.
+
+    The archive is looked up by its key, and only downloaded on a miss.
+    Nothing is evicted here; a caller that keeps using path while other
+    processes may evict holds lock(key, shared = True) meanwhile.
+    """
+    store = download_cache()
+    key = _cache_key(store, urls, sha256)
+    path = store.get(key)
+    if path is not None:
+        return urls[0], path
+    with store.lock(key):
+        # Another process may have filled the entry while we waited.
+        path = store.get(key)
+        if path is not None:
+            return urls[0], path
+        url, out = _race(name, urls, sha256)
+        return url, store.insert(key, out)
+
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _connect(name, urls):
+    """Requests all mirrors at once and returns (url, response) of the
+    first to answer, without waiting for the others; their responses
+    are closed unread whenever they arrive."""
+    pool = concurrent.futures.ThreadPoolExecutor(max(len(urls), 1))
+    futures = {pool.submit(_open, url): url for url in urls}
+    winner = None
+    errors = []
+    for future in concurrent.futures.as_completed(futures):
+        try:
+            response = future.result()
+        except Exception as e:
+            errors.append("%s: %s" % (futures[future], e))
+            continue
+        winner = futures[future], response
+        for other in futures:
+            if other is not future:
+                other.add_done_callback(_close_response)
+        break
+    pool.shutdown(wait = False)
+    if winner is None:
+        raise FetchError("Failed to fetch %s:\n  %s" % (
+            name, "\n  ".join(errors)))
+    return winner
+
+
+def _open(url):
+    response = session().get(url, stream = True, timeout = TIMEOUT)
+    try:
+        response.raise_for_status()
+    except BaseException:
+        response.close()
+        raise
+    response.raw.decode_content = True
+    return response
+
+
+def _stream(name, urls, staging, strip_prefix, sha256, archive_type, key):
+    """Downloads the archive from the fastest mirror and extracts it into
+    staging in the same pass, while copying it into the download cache
+    under key.
+
+    Returns the path of the cache entry.  A mirror that fails, or whose
+    content does not match sha256, is dropped and the download starts
+    over from the remaining ones.
+    """
+    store = download_cache()
+    errors = []
+    urls = list(urls)
+    while urls:
+        try:
+            url, response = _connect(name, urls)
+        except FetchError as e:
+            errors.append(str(e))
+            break
+        urls.remove(url)
+        fmt = archive_format(archive_name(url, archive_type))
+        out_file, out = store.temp_file()
+        try:
+            with tracing.span(url, "fetch"), response, out_file:
+                tee = _Tee(response.raw, out_file)
+                with tracing.span(url, "extract", dest = staging):
+                    _extract_tar(tee, fmt, staging, strip_prefix)
+                tee.drain()
+            digest = tee.digest.hexdigest()
+            if sha256 and digest != sha256.lower():
+                raise FetchError("sha256 mismatch, expected %s but got %s" % (
+                    sha256, digest))
+        except Exception as e:
+            os.remove(out)
+            shutil.rmtree(staging, ignore_errors = True)
+            os.makedirs(staging)
+            errors.append("%s: %s" % (url, e))
+            continue
+        return store.insert(key, out)
+    raise FetchError("Failed to fetch %s:\n  %s" % (name, "\n  ".join(errors)))
+
+
+def fetch_archive(name, urls, dest_dir, strip_prefix = None, sha256 = None,
+                  archive_type = None):
+    """Fetches an archive and extracts the part under strip_prefix, with
+    the prefix removed, into dest_dir.
+
+    The archive comes from the download cache if it is there.  Otherwise
+    tar archives are extracted straight from the HTTP response, hashed
+    and cached on the way, and only kept if sha256 matches.  dest_dir
+    only appears once extraction is complete.
+    """
+    if not urls:
+        raise FetchError("No URLs given for " + name)
+    strip_prefix = (strip_prefix or "").strip("/")
+    parent = os.path.dirname(os.path.abspath(dest_dir))
+    os.makedirs(parent, exist_ok = True)
+    staging = tempfile.mkdtemp(dir = parent, prefix = ".fetch-")
+    store = download_cache()
+    key = _cache_key(store, urls, sha256)
+    try:
+        # Readers share the entry's lock, so evict() leaves it alone.
+        with store.lock(key, shared = True):
+            path = store.get(key)
+            if path is not None:
+                extract_archive(path, staging,
+                                archive_name(urls[0], archive_type),
+                                strip_prefix)
+        if path is None:
+            with store.lock(key):
+                path = store.get(key)
+                if path is not None:
+                    # Another process filled the entry while we waited.
+                    extract_archive(path, staging,
+                                    archive_name(urls[0], archive_type),
+                                    strip_prefix)
+                elif archive_format(
+                        archive_name(urls[0], archive_type)) != "zip":
+                    _stream(name, urls, staging, strip_prefix, sha256,
+                            archive_type, key)
+                else:
+                    # A zip cannot be read as a stream.
+                    url, out = _race(name, urls, sha256)
+                    extract_archive(store.insert(key, out), staging,
+                                    archive_name(url, archive_type),
+                                    strip_prefix)
+            # Only once extracted, and never the entry just added.
+            store.evict(keep = (key,))
+        try:
+            os.rename(staging, dest_dir)
+            staging = None
+        except OSError:
+            # Somebody else extracted it first.
+            if not os.path.isdir(dest_dir):
+                raise
+    finally:
+        if staging is not None:
+            shutil.rmtree(staging, ignore_errors = True)
+    return dest_dir
+
+
+def collect_http_archives(workspace_file):
+    """Returns the keyword arguments of every literal http_archive() call.
+
+    Calls whose arguments are not plain literals are left for evaluation
+    to fetch.
+    """
+    with open(workspace_file, "r") as f:
+        tree = ast.parse(f.read(), workspace_file)
+    archives = []
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and
+                isinstance(node.func, ast.Name) and
+                node.func.id == "http_archive"):
+            continue
+        try:
+            kwargs = {k.arg: ast.literal_eval(k.value) for k in node.keywords}
+        except ValueError:
+            continue
+        if None not in kwargs and kwargs.get("name"):
+            archives.append(kwargs)
+    return archives
+
+
+def prefetch(workspace_file, repo_dir, jobs = MAX_PARALLEL_FETCHES,
+             skip = None):
+    """Fetches every http_archive of workspace_file into repo_dir concurrently.
+
+    Archives are placed where WorkspaceFileFunctions.http_archive expects
+    them, so evaluation skips the download.  Failures are reported and
+    left for evaluation to retry.  skip(kwargs) tells which archives to
+    leave out, such as those another workspace already has.
+    """
+    pending = []
+    for kwargs in collect_http_archives(workspace_file):
+        if skip is not None and skip(kwargs):
+            continue
+        dest_dir = os.path.abspath(os.path.join(repo_dir, kwargs["name"]))
+        if not os.path.exists(dest_dir):
+            pending.append((kwargs["name"], archive_urls(kwargs), dest_dir,
+                            kwargs.get("strip_prefix"), kwargs.get("sha256"),
+                            kwargs.get("type")))
+    if not pending:
+        return
+
+    print("Prefetching %d repositories" % len(pending))
+    with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+        futures = {pool.submit(fetch_archive, *args): args[0]
+                   for args in pending}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print("Failed to prefetch %s: %s" % (futures[future], e))
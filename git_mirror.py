@@ -0,0 +1,158 @@
+"""Shared git mirrors for the repositories that load() reads .bzl files from.
+
+Each remote is cloned once, bare and without blobs where the server
+allows it, into the cache.  Workspaces then get a sparse worktree of
+that mirror holding only the packages their load() labels name (plus
+every .bzl file, since those load each other), instead of a full clone
+with history per workspace.
+
+The commit checked out for each remote is recorded in a pins file the
+first time it is seen, and reused from then on so conversions are
+reproducible.  Each workspace has its own pins file; the mirrors are
+shared.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+
+import git
+
+import cache
+import tracing
+
+PINS_FILE = "bazel_to_cmake.pins.json"
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+class GitMirror(object):
+    def __init__(self, root = None, pins_file = None):
+        if root is None:
+            root = os.path.join(cache.cache_root(), "git")
+        if pins_file is None:
+            pins_file = os.path.abspath(PINS_FILE)
+        self.root = root
+        self.pins_file = pins_file
+        self._lock = threading.Lock()
+        # Commits already looked up, by (pins file, remote), and known to
+        # be in their mirrors.
+        self._pinned = {}
+        os.makedirs(root, exist_ok = True)
+
+    def mirror_path(self, remote):
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", remote.rstrip("/").split("/")[-1])
+        digest = hashlib.sha256(remote.encode("utf-8")).hexdigest()[:12]
+        if not name.endswith(".git"):
+            name += ".git"
+        return os.path.join(self.root, digest + "-" + name)
+
+    def _has_commit(self, mirror, commit):
+        try:
+            git.Git(mirror).cat_file("-e", commit + "^{commit}")
+            return True
+        except git.GitCommandError:
+            return False
+
+    def update(self, remote, commit = None, refresh = False):
+        """Ensures the mirror of remote exists and contains commit.
+
+        The network is only touched when the mirror is missing, does not
+        have the requested commit yet, or refresh asks for the latest
+        branches.
+        """
+        mirror = self.mirror_path(remote)
+        with cache.file_lock(mirror + ".lock"):
+            if not os.path.exists(mirror):
+                print("Mirroring: " + remote)
+                with tracing.span(remote, "git", command = "clone"):
+                    git.Git(self.root).clone("--bare", "--filter=blob:none",
+                                             remote, mirror)
+            elif refresh or (commit is not None and
+                             not self._has_commit(mirror, commit)):
+                print("Updating mirror: " + remote)
+                with tracing.span(remote, "git", command = "fetch"):
+                    git.Git(mirror).fetch("origin", "+refs/heads/*:refs/heads/*",
+                                          "+refs/tags/*:refs/tags/*")
+        return mirror
+
+    @staticmethod
+    def _read_pins(pins_file):
+        if not os.path.exists(pins_file):
+            return {}
+        with open(pins_file, "r") as f:
+            return json.load(f)
+
+    def pinned_commit(self, remote, pins_file = None):
+        """Returns the commit of remote pinned in pins_file (by default
+        the mirror's), pinning its HEAD if new."""
+        pins_file = os.path.abspath(pins_file or self.pins_file)
+        with self._lock:
+            commit = self._pinned.get((pins_file, remote))
+            if commit is not None:
+                return commit
+            pins = self._read_pins(pins_file)
+            commit = pins.get(remote)
+            if commit is not None:
+                self.update(remote, commit)
+                self._pinned[(pins_file, remote)] = commit
+                return commit
+            # A mirror made for another pins file may be stale; pin what
+            # the remote has now.
+            mirror = self.update(remote, refresh = True)
+            commit = git.Git(mirror).rev_parse("HEAD")
+            pins[remote] = self._pinned[(pins_file, remote)] = commit
+            with open(pins_file, "w") as f:
+                json.dump(pins, f, indent = 2, sort_keys = True)
+                f.write("\n")
+            return commit
+
+    def checkout(self, remote, dest, paths, commit = None, pins_file = None):
+        """Materializes paths of remote at the pinned commit under dest.
+
+        dest becomes a sparse worktree of the shared mirror; calling this
+        again for the same dest widens the checkout to the new paths.
+        """
+        if commit is None:
+            commit = self.pinned_commit(remote, pins_file)
+        mirror = self.update(remote, commit)
+        patterns = ["*.bzl"] + [
+            "/" + p.strip("/") + "/" for p in paths if p.strip("/")]
+
+        with cache.file_lock(mirror + ".lock"), \
+                tracing.span(remote, "git", command = "checkout",
+                             paths = list(paths)):
+            if os.path.isfile(os.path.join(dest, ".git")):
+                git.Git(dest).sparse_checkout("add", *patterns)
+                return dest
+            if os.path.isdir(os.path.join(dest, ".git")):
+                # A full clone left by an older run; use it as it is.
+                return dest
+            git.Git(mirror).worktree("prune")
+            os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok = True)
+            git.Git(mirror).worktree("add", "--no-checkout", "--detach",
+                                     os.path.abspath(dest), commit)
+            git.Git(dest).sparse_checkout("set", "--no-cone", *patterns)
+            git.Git(dest).read_tree("-mu", "HEAD")
+        return dest
+
+
+def _process_mirror():
+    global _mirror
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = GitMirror()
+    return _mirror
+
+
+def pinned_commit(remote, pins_file = None):
+    """Returns the commit of remote that checkout() uses."""
+    return _process_mirror().pinned_commit(remote, pins_file)
+
+
+def checkout(remote, dest, paths, commit = None, pins_file = None):
+    """Checks out paths of remote into dest via the process-wide mirror."""
+    return _process_mirror().checkout(remote, dest, paths, commit, pins_file)
@@ -0,0 +1,245 @@
+"""Incremental regeneration support.
+
+A Manifest remembers, for every package evaluated in the previous run,
+the files it read and the glob() results it saw, together with the
+CMake text and targets it added to its Converter.  A package whose
+inputs are unchanged is not evaluated again; what it recorded is
+spliced into the Converter instead.
+
+Packages nest (a WORKSPACE evaluates its subprojects' BUILD files), so
+everything read while a package is open is recorded against it and all
+of its enclosing packages.
+"""
+
+import filecmp
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import bazel_glob
+import cache
+
+MANIFEST_VERSION = 1
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def tool_digest():
+    """Identifies this version of the converter; fragments from another
+    version are never reused."""
+    digest = hashlib.sha256(str(MANIFEST_VERSION).encode("utf-8"))
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(here)):
+        if name.endswith(".py"):
+            digest.update(name.encode("utf-8"))
+            digest.update(file_digest(os.path.join(here, name)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class Manifest(object):
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._tool = tool_digest()
+        self._old = {}
+        self._new = {}
+        self._open = []
+        self._digests = {}
+        # Packages whose inputs are known not to have changed.
+        self._trusted = set()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data.get("tool") == self._tool:
+                self._old = data.get("packages", {})
+
+    @classmethod
+    def for_output(cls, output):
+        """Returns the manifest kept in the cache for the given output file."""
+        key = hashlib.sha256(os.path.abspath(output).encode("utf-8")).hexdigest()
+        return cls(os.path.join(cache.cache_root(), "incremental", key + ".json"))
+
+    def _is_current(self, record):
+        for path, digest in record["files"].items():
+            try:
+                current = self._digests.get(path)
+                if current is None:
+                    current = self._digests[path] = file_digest(path)
+                if current != digest:
+                    return False
+            except OSError:
+                return False
+        for key, files in record["globs"].items():
+            package_dir, include, exclude = json.loads(key)
+            if bazel_glob.glob(package_dir, include, exclude) != files:
+                return False
+        return True
+
+    def lookup(self, package):
+        """Returns the record of package if its inputs are unchanged.
+
+        A hit is carried over into the new manifest and its inputs are
+        recorded against any enclosing packages.
+        """
+        record = self._old.get(package)
+        if record is None or (package not in self._trusted and
+                              not self._is_current(record)):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._new[package] = record
+        # Packages nested in this one are unchanged as well, and must
+        # survive into the next run.
+        for nested in record["nested"]:
+            if nested in self._old:
+                self._new[nested] = self._old[nested]
+        for outer in self._open:
+            outer["files"].update(record["files"])
+            outer["globs"].update(record["globs"])
+            outer["nested"].append(package)
+            outer["nested"].extend(record["nested"])
+        return record
+
+    def record(self, package):
+        """Returns the record stored for package during this run."""
+        return self._new.get(package)
+
+    def adopt(self, package, record, hit):
+        """Takes over the record of a package evaluated in another process."""
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        if record is None:
+            return
+        self._new[package] = record
+        for outer in self._open:
+            outer["files"].update(record["files"])
+            outer["globs"].update(record["globs"])
+            outer["nested"].append(package)
+
+    def begin(self, package, converter):
+        self._open.append({
+            "package": package,
+            "files": {},
+            "globs": {},
+            "nested": [],
+            "start": converter.mark(),
+        })
+
+    def end(self, converter, ok = True):
+        """Closes the innermost package, storing its output if ok."""
+        record = self._open.pop()
+        if not ok:
+            return
+        record["fragments"] = converter.fragments_since(record.pop("start"))
+        package = record.pop("package")
+        self._new[package] = record
+        for outer in self._open:
+            outer["nested"].append(package)
+
+    def record_file(self, path):
+        if not self._open:
+            return
+        path = os.path.abspath(path)
+        digest = self._digests.get(path)
+        if digest is None:
+            digest = self._digests[path] = file_digest(path)
+        for record in self._open:
+            record["files"][path] = digest
+
+    def record_glob(self, package_dir, include, exclude, files):
+        key = json.dumps([os.path.abspath(package_dir), list(include),
+                          list(exclude)])
+        for record in self._open:
+            record["globs"][key] = files
+
+    def rollover(self, changed):
+        """Starts another run in the same process, as in watch mode.
+
+        The records of this run become the previous ones.  Those that
+        read none of the changed paths, and globbed no directory holding
+        one, are reused without checking their inputs; the others are
+        checked as usual.  changed is None when it is not known what
+        changed, and then every record is checked.
+        """
+        self._old = self._new
+        self._new = {}
+        self.hits = self.misses = 0
+        if changed is None:
+            self._digests.clear()
+            self._trusted = set()
+            return
+        changed = [os.path.abspath(p) for p in changed]
+        directories = set(os.path.dirname(p) for p in changed)
+        for path in changed:
+            self._digests.pop(path, None)
+        self._trusted = set()
+        for package, record in self._old.items():
+            if any(p in record["files"] for p in changed):
+                continue
+            globbed = set(json.loads(key)[0] for key in record["globs"])
+            if any(d == g or d.startswith(g + os.sep)
+                   for d in directories for g in globbed):
+                continue
+            self._trusted.add(package)
+
+    def inputs(self):
+        """Returns the files read and the directories globbed by the
+        packages recorded in this run."""
+        files = set()
+        globbed = set()
+        for record in self._new.values():
+            files.update(record["files"])
+            globbed.update(json.loads(key)[0] for key in record["globs"])
+        return files, globbed
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok = True)
+        fd, tmp = tempfile.mkstemp(dir = os.path.dirname(self.path))
+        with os.fdopen(fd, "w") as f:
+            json.dump({"tool": self._tool, "packages": self._new}, f)
+        os.replace(tmp, self.path)
+
+
+def write_if_changed(path, chunks):
+    """Streams the text chunks to path unless it already holds exactly that.
+
+    The output goes to a temporary file next to path, so memory use does
+    not grow with the output.  Leaving an identical file alone keeps its
+    mtime, so CMake does not reconfigure.  Returns True if path was
+    written.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir = directory, suffix = ".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding = "utf-8", newline = "") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        if os.path.exists(path) and filecmp.cmp(tmp, path, shallow = False):
+            return False
+        if os.path.exists(path):
+            shutil.copymode(path, tmp)
+        else:
+            os.chmod(tmp, 0o666 & ~_umask())
+        os.replace(tmp, path)
+        tmp = None
+        return True
+    finally:
+        if tmp is not None:
+            os.remove(tmp)
+
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
@@ -0,0 +1,86 @@
+"""Cache of evaluated .bzl modules.
+
+Every .bzl file is evaluated at most once per run, into its own globals.
+Its public (non-underscore) symbols are then frozen into a Module, and
+load() binds just the requested symbols from it.  Modules are keyed by
+their canonical label, which is resolved to the file it names so that
+different spellings of the same label share one module.
+"""
+
+import os
+import types
+
+
+class LoadCycleError(Exception):
+    pass
+
+
+class Module(object):
+    __slots__ = ("label", "key", "symbols", "files")
+
+    def __init__(self, label, key, symbols, files):
+        self.label = label
+        self.key = key
+        self.symbols = symbols
+        self.files = files
+
+
+class ModuleCache(object):
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._modules = {}
+        self._loading = []
+
+    def get(self, key, label, evaluate):
+        """Returns the module for key, calling evaluate() to build it once.
+
+        evaluate() returns the globals the module's file defined.  Loading
+        a module that is still being evaluated raises LoadCycleError.
+        """
+        module = self._modules.get(key)
+        if module is not None:
+            self.hits += 1
+            self.record_files(module.files)
+            return module
+        for i, (loading, _, _) in enumerate(self._loading):
+            if loading == key:
+                cycle = [l for _, l, _ in self._loading[i:]] + [label]
+                raise LoadCycleError("load() cycle: " + " -> ".join(cycle))
+
+        self.misses += 1
+        files = set()
+        self._loading.append((key, label, files))
+        try:
+            symbols = evaluate()
+        finally:
+            self._loading.pop()
+        module = Module(label, key, types.MappingProxyType(
+            {k: v for k, v in symbols.items() if not k.startswith("_")}),
+            frozenset(files))
+        self._modules[key] = module
+        self.record_files(module.files)
+        return module
+
+    def invalidate(self, paths):
+        """Forgets the modules that read any of paths, which have changed."""
+        paths = set(os.path.realpath(p) for p in paths)
+        for key, module in list(self._modules.items()):
+            if not paths.isdisjoint(module.files):
+                del self._modules[key]
+
+    def invalidate_all(self):
+        self._modules.clear()
+
+    def record_files(self, files):
+        """Notes files as inputs of every module still being evaluated."""
+        for _, _, loading_files in self._loading:
+            loading_files.update(files)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def add_stats(self, stats):
+        """Folds in the counters of a cache used by another process."""
+        self.hits += stats["hits"]
+        self.misses += stats["misses"]
@@ -0,0 +1,107 @@
+"""Discovery of the Bazel packages that make up a project.
+
+A package is a directory with a BUILD (or BUILD.bazel) file.  Other
+repositories that live inside the project directory, such as local
+repositories, fetched archives and git worktrees, are not part of it and
+are skipped, as are hidden directories, bazel-* output symlinks and
+anything listed in .bazelignore.
+"""
+
+import ast
+import os
+
+import bazel_glob
+
+BUILD_FILES = bazel_glob.BUILD_FILES
+WORKSPACE_FILES = ("WORKSPACE", "WORKSPACE.bazel")
+EXTERNAL_MARKER = ".bazel_to_cmake_external"
+
+
+def mark_external(path):
+    """Marks the directory at path as holding another repository."""
+    marker = os.path.join(path, EXTERNAL_MARKER)
+    if os.path.isdir(path) and not os.path.exists(marker):
+        open(marker, "w").close()
+
+
+def build_file(package_dir):
+    """Returns the BUILD file of the package at package_dir, or None."""
+    files, _ = bazel_glob.listing(os.path.abspath(package_dir))
+    for name in BUILD_FILES:
+        if name in files:
+            return os.path.join(package_dir, name)
+    return None
+
+
+def repository_root(path):
+    """Returns the root of the repository containing the directory path,
+    which "//" labels are resolved against."""
+    path = os.path.abspath(path)
+    current = path
+    while True:
+        files, _ = bazel_glob.listing(current)
+        if _is_other_repository(files):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return path
+        current = parent
+
+
+def _ignored(proj_dir):
+    path = os.path.join(proj_dir, ".bazelignore")
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r") as f:
+        return set(line.strip().strip("/") for line in f
+                   if line.strip() and not line.startswith("#"))
+
+
+def _is_other_repository(files):
+    # Not .git: submodules and vendored checkouts are part of the project;
+    # the git worktrees of other repositories are marked external instead.
+    return (EXTERNAL_MARKER in files or
+            any(w in files for w in WORKSPACE_FILES))
+
+
+def find_packages(proj_dir):
+    """Returns (package path, BUILD file) for every package of proj_dir.
+
+    Package paths are relative to proj_dir ("" for the root package) and
+    the list is sorted by them, so the root package comes first.
+    """
+    proj_dir = os.path.abspath(proj_dir)
+    ignored = _ignored(proj_dir)
+    found = []
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        path = os.path.join(proj_dir, rel)
+        files, dirs = bazel_glob.listing(path)
+        build = build_file(path)
+        if build is not None:
+            found.append((rel, build))
+        for name in dirs:
+            child = rel + "/" + name if rel else name
+            if name.startswith(".") or name.startswith("bazel-") or \
+                    child in ignored:
+                continue
+            child_files, _ = bazel_glob.listing(os.path.join(proj_dir, child))
+            if _is_other_repository(child_files):
+                continue
+            stack.append(child)
+    return sorted(found)
+
+
+def static_loads(filename):
+    """Returns the literal arguments of every load() call in filename."""
+    with open(filename, "rb") as f:
+        tree = ast.parse(f.read(), filename)
+    loads = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and \
+                node.func.id == "load" and node.args and \
+                all(isinstance(a, ast.Constant) and isinstance(a.value, str)
+                    for a in node.args):
+            loads.append(tuple(a.value for a in node.args))
+    return loads
@@ -0,0 +1,173 @@
+"""Index of the external repositories a conversion uses.
+
+Repositories are identified by their contents rather than their names:
+an http_archive() by its sha256 (or its URLs, without one) and
+strip_prefix, a git repository by its remote and commit, and a
+local_repository() by its real path.  Every name a repository is
+declared under maps to one Repository, which is fetched, extracted or
+checked out once, where its first declaration put it, and evaluated
+into one Converter, however many subprojects declare it.
+
+When a name is declared again for different contents, the version
+policy picks the one the name refers to:
+
+    first   the first declaration wins, as in Bazel (the default);
+    newest  the highest version wins, read from strip_prefix or the
+            archive name (1.2.3, 20230125.3); a version already loaded
+            stays in use by what loaded it;
+    error   the conflict is an error.
+"""
+
+import os
+import re
+
+POLICIES = ("first", "newest", "error")
+
+_ARCHIVE_SUFFIX = re.compile(r"\.(tar(\.\w+)?|tgz|tbz2?|txz|zip)$")
+# Dotted versions, or date-like ones such as abseil's 20230125.
+_VERSION = re.compile(r"\d+(?:\.\d+)+|\d{8,}")
+
+
+class RepositoryConflict(Exception):
+    pass
+
+
+def archive_identity(urls, sha256, strip_prefix):
+    if sha256:
+        content = ("sha256", sha256)
+    else:
+        content = ("urls",) + tuple(sorted(urls))
+    return ("archive",) + content + (strip_prefix or "",)
+
+
+def git_identity(remote, commit):
+    return ("git", remote.rstrip("/"), commit)
+
+
+def local_identity(path):
+    return ("local", os.path.realpath(path))
+
+
+def parse_version(*names):
+    """Returns the version in the first of names that has one, as a tuple
+    of ints, or None."""
+    for name in names:
+        if not name:
+            continue
+        name = _ARCHIVE_SUFFIX.sub("", name.rstrip("/").rsplit("/", 1)[-1])
+        found = _VERSION.findall(name)
+        if found:
+            return tuple(int(part) for part in found[-1].split("."))
+    return None
+
+
+def _format_version(version):
+    return ".".join(str(part) for part in version) if version else "?"
+
+
+class Repository(object):
+    """One materialized repository.
+
+    path is where it is fetched, extracted or checked out, attrs the
+    rule attributes of its first declaration and owner the Converter
+    that declared it first, which it is added to.  subproject is the
+    Converter it was evaluated into, if it has a WORKSPACE.
+    """
+
+    __slots__ = ("identity", "version", "path", "attrs", "owner", "names",
+                 "loaded", "subproject")
+
+    def __init__(self, identity, version, path, attrs, owner):
+        self.identity = identity
+        self.version = version
+        self.path = path
+        self.attrs = attrs
+        self.owner = owner
+        self.names = set()
+        self.loaded = False
+        self.subproject = None
+
+
+class RepositoryIndex(object):
+    def __init__(self, policy = "first"):
+        assert policy in POLICIES, "Unknown version policy: " + policy
+        self.policy = policy
+        self._by_identity = {}
+        self._by_name = {}
+        self._declarations = set()
+        # Declarations served by a repository put elsewhere.
+        self.avoided = 0
+        # (name, repository used, repository not used)
+        self.conflicts = []
+
+    def _choose(self, name, current, candidate):
+        if self.policy == "error":
+            raise RepositoryConflict(
+                "Repository %s is declared as both %s and %s" % (
+                    name, current.identity, candidate.identity))
+        if self.policy == "newest" and candidate.version is not None and \
+                (current.version is None or candidate.version > current.version):
+            return candidate
+        return current
+
+    def declare(self, name, identity, path, owner = None, attrs = None,
+                version = None):
+        """Records that owner declared name for the repository identity,
+        to be put at path.  Returns the Repository name refers to now."""
+        repository = self._by_identity.get(identity)
+        if repository is None:
+            repository = Repository(identity, version, path, attrs or {}, owner)
+            self._by_identity[identity] = repository
+        repository.names.add(name)
+        current = self._by_name.get(name)
+        if current is None:
+            chosen = repository
+        elif current is repository:
+            chosen = current
+        else:
+            chosen = self._choose(name, current, repository)
+            self.conflicts.append((name, chosen,
+                                   repository if chosen is current else current))
+        self._by_name[name] = chosen
+        if (name, identity, path) not in self._declarations:
+            self._declarations.add((name, identity, path))
+            if chosen.path != path:
+                self.avoided += 1
+        return chosen
+
+    def get(self, name):
+        return self._by_name.get(name)
+
+    def known(self, name, identity):
+        """Tells whether declaring name for identity would reuse a
+        repository that is already declared."""
+        return identity in self._by_identity or name in self._by_name
+
+    def claim(self, name):
+        """Returns (repository, first) for name, where first is True only
+        the first time, when the caller has to load the repository."""
+        repository = self._by_name[name]
+        if repository.loaded:
+            return repository, False
+        repository.loaded = True
+        return repository, True
+
+    def summary(self):
+        """Returns a report of the repositories declared more than once
+        and of the conflicting declarations."""
+        shared = [r for r in self._by_identity.values()
+                  if len(set(p for n, i, p in self._declarations
+                             if i == r.identity)) > 1]
+        lines = ["Repositories: %d declarations of %d repositories, "
+                 "%d served by an existing checkout, %d conflicts" % (
+                     len(self._declarations), len(self._by_identity),
+                     self.avoided, len(self.conflicts))]
+        for repository in sorted(shared, key = lambda r: r.path):
+            lines.append("  %s (%s) at %s" % (
+                ", ".join(sorted(repository.names)),
+                _format_version(repository.version), repository.path))
+        for name, used, unused in self.conflicts:
+            lines.append("  %s: using %s, not %s (%s policy)" % (
+                name, _format_version(used.version),
+                _format_version(unused.version), self.policy))
+        return "\n".join(lines)
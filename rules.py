@@ -0,0 +1,131 @@
+"""Prebuilt tables of the functions Bazel files can call.
+
+A RuleSet is built once from a handler class (and any extra handlers
+registered on top of it) and never changes afterwards, so it can be
+shared by every file and every worker.  Evaluating a file only needs a
+per-package context object, an instance of the handler class, and a
+Namespace that binds the handlers to that context on first use instead
+of binding all of them up front.
+
+Functions defined in .bzl files outlive the file that defined them and
+are called from whichever package uses them, so their globals see the
+rules through module_builtins(), which dispatches to the context of the
+file currently being evaluated.
+"""
+
+import builtins
+import contextlib
+import types
+
+import tracing
+
+_frames = []
+
+
+@contextlib.contextmanager
+def evaluating(context, namespace, rule_set):
+    """Marks the file with the given namespace as being evaluated."""
+    _frames.append((context, namespace, rule_set))
+    try:
+        yield
+    finally:
+        _frames.pop()
+
+
+def current_context():
+    return _frames[-1][0]
+
+
+def current_rule_set():
+    return _frames[-1][2]
+
+
+def current_namespace():
+    """Returns the globals of the file being evaluated; load() binds here."""
+    return _frames[-1][1]
+
+
+def _dispatcher(name):
+    def dispatch(*args, **kwargs):
+        context, _, rule_set = _frames[-1]
+        handler = rule_set.get(name)
+        if handler is None:
+            raise NameError("name '%s' is not defined" % name)
+        if tracing.enabled():
+            handler = tracing.wrap_rule(name, handler)
+        return handler(context, *args, **kwargs)
+    dispatch.__name__ = name
+    return dispatch
+
+
+class RuleSet(object):
+    """An immutable mapping of names to rule handlers."""
+
+    __slots__ = ("_table", "names", "_builtins")
+
+    def __init__(self, table):
+        self._table = types.MappingProxyType(dict(table))
+        self.names = frozenset(self._table)
+        self._builtins = None
+
+    @classmethod
+    def from_class(cls, handler_class):
+        """Collects the public attributes of handler_class."""
+        return cls({k: getattr(handler_class, k) for k in dir(handler_class)
+                    if not k.startswith("__")})
+
+    def extend(self, handlers):
+        """Returns a new RuleSet with handlers added or overridden.
+
+        Handlers are called like methods: handler(context, *args, **kwargs).
+        """
+        table = dict(self._table)
+        table.update(handlers)
+        return RuleSet(table)
+
+    def get(self, name):
+        return self._table.get(name)
+
+    def namespace(self, context):
+        return Namespace(self, context)
+
+    def module_builtins(self):
+        """Returns the __builtins__ for files evaluated against this set.
+
+        Python's builtins plus every rule, where a rule call goes to the
+        context of whichever file is being evaluated at the time.
+        """
+        if self._builtins is None:
+            table = dict(vars(builtins))
+            for name, value in self._table.items():
+                table[name] = (_dispatcher(name)
+                               if isinstance(value, types.FunctionType)
+                               else value)
+            self._builtins = types.MappingProxyType(table)
+        return self._builtins
+
+
+class Namespace(dict):
+    """The globals of one evaluated BUILD or WORKSPACE file.
+
+    Names the file assigns or loads are stored in the dict itself; at
+    the top level anything else is looked up in the RuleSet and, if it
+    is a function, bound to the context on first use.
+    """
+
+    __slots__ = ("_rules", "_context")
+
+    def __init__(self, rule_set, context):
+        dict.__init__(self)
+        self._rules = rule_set
+        self._context = context
+        self["__builtins__"] = rule_set.module_builtins()
+
+    def __missing__(self, name):
+        value = self._rules._table[name]
+        if isinstance(value, types.FunctionType):
+            if tracing.enabled():
+                value = tracing.wrap_rule(name, value)
+            value = types.MethodType(value, self._context)
+        self[name] = value
+        return value
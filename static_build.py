@@ -0,0 +1,200 @@
+"""Static front end for declarative BUILD files.
+
+Most BUILD files are nothing but rule calls with literal arguments.
+Those are parsed with ast into RuleRecords and dispatched straight to
+the rule handlers, without exec.  glob() and select() calls and list
+concatenation inside arguments are kept as deferred values and resolved
+against the package when the records are applied.
+
+parse() is a pure function of the source text, so it needs no shared
+state and its results are cached by content hash.  Files with control
+flow, assignments, or calls to anything other than known rules make it
+return None, and the caller falls back to exec.
+"""
+
+import ast
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+import cache
+
+FORMAT_VERSION = 1
+
+STATIC = "static"
+EXEC = "exec"
+
+stats = {STATIC: 0, EXEC: 0}
+
+_parsed = {}
+_parsed_lock = threading.Lock()
+
+
+class NotStatic(Exception):
+    pass
+
+
+class RuleRecord(object):
+    __slots__ = ("kind", "args", "kwargs", "lineno")
+
+    def __init__(self, kind, args, kwargs, lineno):
+        self.kind = kind
+        self.args = args
+        self.kwargs = kwargs
+        self.lineno = lineno
+
+    def __getstate__(self):
+        return (self.kind, self.args, self.kwargs, self.lineno)
+
+    def __setstate__(self, state):
+        self.kind, self.args, self.kwargs, self.lineno = state
+
+
+class Glob(object):
+    __slots__ = ("args", "kwargs")
+
+    def __init__(self, args, kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+    def __getstate__(self):
+        return (self.args, self.kwargs)
+
+    def __setstate__(self, state):
+        self.args, self.kwargs = state
+
+
+class Select(Glob):
+    __slots__ = ()
+
+
+class Concat(object):
+    __slots__ = ("left", "right")
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def __getstate__(self):
+        return (self.left, self.right)
+
+    def __setstate__(self, state):
+        self.left, self.right = state
+
+
+_DEFERRED = {"glob": Glob, "select": Select}
+
+
+def _value(node):
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, (ast.List, ast.Tuple)):
+        values = [_value(e) for e in node.elts]
+        return values if isinstance(node, ast.List) else tuple(values)
+    if isinstance(node, ast.Dict):
+        if None in node.keys:
+            raise NotStatic("dict unpacking")
+        return {_value(k): _value(v) for k, v in zip(node.keys, node.values)}
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left, right = _value(node.left), _value(node.right)
+        if isinstance(left, (Glob, Concat)) or isinstance(right, (Glob, Concat)):
+            return Concat(left, right)
+        return left + right
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and \
+            node.func.id in _DEFERRED:
+        args, kwargs = _arguments(node)
+        return _DEFERRED[node.func.id](args, kwargs)
+    raise NotStatic(type(node).__name__)
+
+
+def _arguments(call):
+    if any(isinstance(a, ast.Starred) for a in call.args) or \
+            any(k.arg is None for k in call.keywords):
+        raise NotStatic("argument unpacking")
+    return ([_value(a) for a in call.args],
+            {k.arg: _value(k.value) for k in call.keywords})
+
+
+def parse(source, filename, known):
+    """Returns the RuleRecords of a declarative BUILD file, or None.
+
+    known is the set of rule and function names the file may call.
+    """
+    try:
+        tree = ast.parse(source, filename)
+        records = []
+        for stmt in tree.body:
+            if not isinstance(stmt, ast.Expr):
+                raise NotStatic(type(stmt).__name__)
+            if isinstance(stmt.value, ast.Constant) and \
+                    isinstance(stmt.value.value, str):
+                continue  # A docstring or comment string.
+            call = stmt.value
+            if not (isinstance(call, ast.Call) and
+                    isinstance(call.func, ast.Name) and call.func.id in known):
+                raise NotStatic("call")
+            args, kwargs = _arguments(call)
+            records.append(RuleRecord(call.func.id, args, kwargs, stmt.lineno))
+        return records
+    except (NotStatic, SyntaxError, ValueError, TypeError):
+        return None
+
+
+def _cache_path(key):
+    return os.path.join(cache.cache_root(), "static", key[-2:], key)
+
+
+def parse_file(filename, known):
+    """Like parse(), reading filename and caching the result on disk."""
+    with open(filename, "rb") as f:
+        source = f.read()
+    digest = hashlib.sha256(str(FORMAT_VERSION).encode("utf-8") + b"\0")
+    digest.update(source)
+    digest.update(b"\0" + "\0".join(sorted(known)).encode("utf-8"))
+    key = digest.hexdigest()
+    with _parsed_lock:
+        if key in _parsed:
+            return _parsed[key]
+
+    path = _cache_path(key)
+    try:
+        with open(path, "rb") as f:
+            records = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        records = parse(source, filename, known)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        fd, tmp = tempfile.mkstemp(dir = os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(records, f)
+        os.replace(tmp, path)
+    with _parsed_lock:
+        _parsed[key] = records
+    return records
+
+
+def resolve(value, functions):
+    """Evaluates the deferred glob(), select() and + inside value."""
+    if isinstance(value, Select):
+        return functions["select"](*resolve(value.args, functions),
+                                   **resolve(value.kwargs, functions))
+    if isinstance(value, Glob):
+        return functions["glob"](*resolve(value.args, functions),
+                                 **resolve(value.kwargs, functions))
+    if isinstance(value, Concat):
+        return resolve(value.left, functions) + resolve(value.right, functions)
+    if isinstance(value, list):
+        return [resolve(v, functions) for v in value]
+    if isinstance(value, tuple):
+        return tuple(resolve(v, functions) for v in value)
+    if isinstance(value, dict):
+        return {k: resolve(v, functions) for k, v in value.items()}
+    return value
+
+
+def apply(records, functions):
+    """Calls the handler in functions for each record, in file order."""
+    for record in records:
+        functions[record.kind](*resolve(record.args, functions),
+                               **resolve(record.kwargs, functions))
@@ -0,0 +1,348 @@
+"""In-memory graph of the targets a project defines.
+
+Rule handlers record a Target for each rule instead of writing CMake
+text directly; the text is generated afterwards by walking the graph in
+topological order, so every target comes after the targets it depends
+on.
+
+Targets are compact __slots__ records whose label, package, kind and
+name strings are interned, and the graph indexes them by label, package
+and rule kind.  Dependency edges are kept as adjacency arrays in
+compressed sparse row form (an offsets array into one flat array of
+target indices), built once after all targets are added, so any pass
+over the graph is O(V + E) and costs a few bytes per edge.
+"""
+
+import array
+import re
+import sys
+
+_NOT_CMAKE = re.compile(r"[^A-Za-z0-9_.+-]")
+
+
+def canonical_label(label, package):
+    """Returns label, as written in package, in //package:name form.
+
+    Labels in other repositories (@repo//...) are returned unchanged.
+    """
+    if label.startswith("@"):
+        return sys.intern(label)
+    if label.startswith("//"):
+        if ":" not in label:
+            label += ":" + label.rsplit("/", 1)[-1]
+        return sys.intern(label)
+    if label.startswith(":"):
+        label = label[1:]
+    return sys.intern("//%s:%s" % (package, label))
+
+
+def package_of(label):
+    """Returns the package of a //package:name label."""
+    return label[2:label.index(":")]
+
+
+def cmake_name(package, name):
+    """Returns the CMake target name of //package:name.
+
+    Targets of the root package keep their name; the others get their
+    package as a prefix, so //a:util and //b:util become a_util and
+    b_util and can share one CMake project.  Different labels can map to
+    the same name; TargetGraph.cmake_name() has the unique one.
+    """
+    if package:
+        name = package + "_" + name
+    return sys.intern(_NOT_CMAKE.sub("_", name))
+
+
+class Target(object):
+    """One rule instance.
+
+    srcs, hdrs and textual_hdrs are paths relative to the project, deps
+    are the labels as written in the BUILD file.
+    """
+
+    __slots__ = ("label", "kind", "package", "name", "srcs", "hdrs", "deps",
+                 "copts", "linkopts", "textual_hdrs", "linkstatic",
+                 "alwayslink")
+
+    def __init__(self, kind, package, name, srcs = (), hdrs = (), deps = (),
+                 copts = (), linkopts = (), textual_hdrs = (),
+                 linkstatic = False, alwayslink = False):
+        self.kind = sys.intern(kind)
+        self.package = sys.intern(package)
+        self.name = sys.intern(name)
+        self.label = canonical_label(":" + name, package)
+        self.srcs = tuple(srcs)
+        self.hdrs = tuple(hdrs)
+        self.deps = tuple(sys.intern(d) for d in deps)
+        self.copts = tuple(copts)
+        self.linkopts = tuple(linkopts)
+        self.textual_hdrs = tuple(textual_hdrs)
+        self.linkstatic = bool(linkstatic)
+        self.alwayslink = bool(alwayslink)
+
+    def __getstate__(self):
+        return (self.kind, self.package, self.name, self.srcs, self.hdrs,
+                self.deps, self.copts, self.linkopts, self.textual_hdrs,
+                self.linkstatic, self.alwayslink)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuilds a target from __getstate__(), or its JSON round trip."""
+        return cls(*state)
+
+
+class TargetGraph(object):
+    def __init__(self):
+        self.targets = []
+        self.by_label = {}
+        self.by_package = {}
+        self.by_kind = {}
+        # CMake target names, by index and the other way round.
+        self.cmake_names = []
+        self._by_cmake_name = {}
+        self.repositories = {}
+        # Repositories whose targets another project's graph holds.
+        self.external = {}
+        self._edges = None
+        self._reduction = None
+
+    def __len__(self):
+        return len(self.targets)
+
+    def add(self, target):
+        """Adds target and returns its index."""
+        assert target.label not in self.by_label, \
+            "Duplicate target " + target.label
+        index = len(self.targets)
+        self.targets.append(target)
+        self.by_label[target.label] = index
+        self.by_package.setdefault(target.package, []).append(index)
+        self.by_kind.setdefault(target.kind, []).append(index)
+        self._add_cmake_name(index)
+        self._edges = None
+        self._reduction = None
+        return index
+
+    def _add_cmake_name(self, index):
+        """Gives target index a CMake name no other target has.
+
+        cmake_name() maps //a/b:c and //a:b_c, or //:a_util and //a:util,
+        to the same name; the target added later gets a numeric suffix.
+        """
+        target = self.targets[index]
+        base = name = cmake_name(target.package, target.name)
+        suffix = 2
+        while name in self._by_cmake_name:
+            name = "%s_%d" % (base, suffix)
+            suffix += 1
+        if name != base:
+            print("%s and %s both map to CMake target %s; naming %s %s" % (
+                self.targets[self._by_cmake_name[base]].label, target.label,
+                base, target.label, name))
+        self._by_cmake_name[name] = index
+        self.cmake_names.append(sys.intern(name))
+
+    def cmake_name(self, index):
+        """Returns the CMake target name of target index."""
+        return self.cmake_names[index]
+
+    def add_repository(self, name, package, external = False):
+        """Makes @name//pkg:t labels refer to the targets in package/pkg,
+        of this graph or, if external, of the project that defines the
+        repository."""
+        if external:
+            self.external[name] = package
+        else:
+            self.repositories[name] = package
+        self._edges = None
+        self._reduction = None
+
+    @staticmethod
+    def _in_repository(label, repositories):
+        """Returns (package, name) of the target that @repo//pkg:name
+        names, if repo is in repositories, or None."""
+        if "//" not in label:
+            label += "//:" + label[1:]
+        repo, rest = label[1:].split("//", 1)
+        prefix = repositories.get(repo)
+        if prefix is None:
+            return None
+        rest = canonical_label("//" + rest, "")
+        return ("/".join(p for p in (prefix, package_of(rest)) if p),
+                rest[rest.index(":") + 1:])
+
+    def resolve(self, label, package):
+        """Returns the canonical form of label, as written in package.
+
+        Labels in a repository whose targets are part of this graph are
+        mapped to the packages holding them.
+        """
+        label = canonical_label(label, package)
+        if not label.startswith("@"):
+            return label
+        found = self._in_repository(label, self.repositories)
+        if found is None:
+            return label
+        return sys.intern("//%s:%s" % found)
+
+    def external_name(self, label, package):
+        """Returns the CMake name of label, as written in package, if it
+        is in a repository another project defines, or else None."""
+        label = canonical_label(label, package)
+        if not label.startswith("@"):
+            return None
+        found = self._in_repository(label, self.external)
+        if found is None:
+            return None
+        return cmake_name(*found)
+
+    def _link(self):
+        """Builds the deps and reverse deps adjacency arrays."""
+        if self._edges is not None:
+            return self._edges
+        dep_offsets = array.array("l", [0])
+        dep_edges = array.array("l")
+        unresolved = {}
+        in_degree = array.array("l", [0]) * (len(self.targets) + 1)
+        for index, target in enumerate(self.targets):
+            for dep in target.deps:
+                dep_index = self.by_label.get(self.resolve(dep, target.package))
+                if dep_index is None:
+                    unresolved.setdefault(index, []).append(dep)
+                    continue
+                dep_edges.append(dep_index)
+                in_degree[dep_index + 1] += 1
+            dep_offsets.append(len(dep_edges))
+
+        # Counting sort of the edges by their head gives the reverse deps.
+        for i in range(len(self.targets)):
+            in_degree[i + 1] += in_degree[i]
+        rdep_offsets = array.array("l", in_degree)
+        rdep_edges = array.array("l", [0]) * len(dep_edges)
+        fill = array.array("l", in_degree)
+        for index in range(len(self.targets)):
+            for e in range(dep_offsets[index], dep_offsets[index + 1]):
+                dep_index = dep_edges[e]
+                rdep_edges[fill[dep_index]] = index
+                fill[dep_index] += 1
+
+        self._edges = (dep_offsets, dep_edges, rdep_offsets, rdep_edges,
+                       unresolved)
+        return self._edges
+
+    def deps(self, index):
+        """Returns the indices of the targets index depends on."""
+        offsets, edges = self._link()[0:2]
+        return edges[offsets[index]:offsets[index + 1]]
+
+    def rdeps(self, index):
+        """Returns the indices of the targets that depend on index."""
+        offsets, edges = self._link()[2:4]
+        return edges[offsets[index]:offsets[index + 1]]
+
+    def unresolved(self, index):
+        """Returns the deps of index that name no target in the graph,
+        such as targets in other repositories."""
+        return tuple(self._link()[4].get(index, ()))
+
+    def topological_order(self, roots = None):
+        """Returns every target index, each after all of its deps.
+
+        Targets are otherwise kept in the order they were added.  Given
+        roots, only those targets and their transitive deps are returned.
+        """
+        dep_offsets, dep_edges = self._link()[0:2]
+        # 0: not visited, 1: on the stack, 2: done.
+        state = bytearray(len(self.targets))
+        order = []
+        if roots is None:
+            roots = range(len(self.targets))
+        for root in roots:
+            if state[root]:
+                continue
+            state[root] = 1
+            stack = [(root, dep_offsets[root])]
+            while stack:
+                index, edge = stack[-1]
+                if edge == dep_offsets[index + 1]:
+                    stack.pop()
+                    state[index] = 2
+                    order.append(index)
+                    continue
+                stack[-1] = (index, edge + 1)
+                dep_index = dep_edges[edge]
+                if state[dep_index] == 1:
+                    cycle = [self.targets[i].label for i, _ in stack]
+                    cycle = cycle[cycle.index(self.targets[dep_index].label):]
+                    assert False, "Dependency cycle: " + " -> ".join(
+                        cycle + [self.targets[dep_index].label])
+                if state[dep_index] == 0:
+                    state[dep_index] = 1
+                    stack.append((dep_index, dep_offsets[dep_index]))
+        return order
+
+    def transitive_reduction(self, propagates):
+        """Drops the deps that are reachable through other deps anyway.
+
+        propagates(target) tells whether the deps of target are passed on
+        to the targets that depend on it (PUBLIC or INTERFACE linking);
+        a dep is only redundant when another dep passes it on.  Returns
+        (deps, removed): the remaining deps of each target, and a list
+        of (target, dep, via) for every edge dropped, where via is the
+        dep that already provides it (None for duplicates).  Deps on
+        alwayslink targets are always kept.
+
+        Reachability is kept as one integer bitset per target, indexed by
+        topological position, and a target's bitset is freed as soon as
+        all of its dependents have been processed.
+        """
+        if self._reduction is not None and self._reduction[0] is propagates:
+            return self._reduction[1]
+        order = self.topological_order()
+        position = array.array("l", [0]) * len(self.targets)
+        for pos, index in enumerate(order):
+            position[index] = pos
+        rdep_offsets = self._link()[2]
+        remaining = array.array("l", (rdep_offsets[i + 1] - rdep_offsets[i]
+                                      for i in range(len(self.targets))))
+        # Positions of the targets whose link interface a target passes on.
+        reach = {}
+        kept = [()] * len(self.targets)
+        removed = []
+        for index in order:
+            deps = self.deps(index)
+            covered = 0
+            for dep in deps:
+                covered |= reach[dep]
+            keep = []
+            seen = set()
+            for dep in deps:
+                if dep in seen:
+                    removed.append((index, dep, None))
+                elif covered >> position[dep] & 1 and \
+                        not self.targets[dep].alwayslink:
+                    via = next(d for d in deps
+                               if reach[d] >> position[dep] & 1)
+                    removed.append((index, dep, via))
+                else:
+                    keep.append(dep)
+                seen.add(dep)
+            kept[index] = tuple(keep)
+            if propagates(self.targets[index]):
+                for dep in deps:
+                    covered |= 1 << position[dep]
+                reach[index] = covered
+            else:
+                reach[index] = 0
+            for dep in deps:
+                remaining[dep] -= 1
+                if not remaining[dep]:
+                    del reach[dep]
+            if not remaining[index]:
+                del reach[index]
+        self._reduction = (propagates, (kept, removed))
+        return kept, removed
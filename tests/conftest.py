@@ -0,0 +1,64 @@
+import functools
+import http.server
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fetch
+
+
+class _Handler(http.server.SimpleHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """Points the shared caches at an empty directory for one test."""
+    root = tmp_path / "cache"
+    monkeypatch.setenv("BAZEL_TO_CMAKE_CACHE_DIR", str(root))
+    monkeypatch.setattr(fetch, "_download_cache", None)
+    return root
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    """Serves a directory over HTTP.
+
+    Yields the server, with its base URL in url and the directory it
+    serves in root.  Setting delay makes every GET wait that long first.
+    """
+    root = tmp_path / "www"
+    root.mkdir()
+    handler = functools.partial(_Handler, directory = str(root))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.delay = 0
+    server.url = "http://127.0.0.1:%d" % server.server_address[1]
+    server.root = root
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def dead_url():
+    """A URL on a port nothing listens on, so connecting is refused."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return "http://127.0.0.1:%d/archive.tar.gz" % port
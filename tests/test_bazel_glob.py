@@ -0,0 +1,31 @@
+import bazel_glob
+
+
+def _touch(root, *names):
+    for name in names:
+        path = root / name
+        path.parent.mkdir(parents = True, exist_ok = True)
+        path.write_text("")
+
+
+def test_glob_matches_with_bazel_semantics(tmp_path):
+    _touch(tmp_path, "a.cc", "a.h", "x/b.cc", "x/y/c.cc", "x/y/c_test.cc")
+
+    assert bazel_glob.glob(str(tmp_path), ["*.cc"]) == ["a.cc"]
+    assert bazel_glob.glob(str(tmp_path), ["**/*.cc"], ["**/*_test.cc"]) == [
+        "a.cc", "x/b.cc", "x/y/c.cc"]
+    assert bazel_glob.glob(str(tmp_path), ["x/*/*.cc"], ["x/y/c.cc"]) == [
+        "x/y/c_test.cc"]
+
+
+def test_glob_stops_at_subpackages(tmp_path):
+    _touch(tmp_path, "a.cc", "sub/BUILD", "sub/s.cc", "sub/deep/d.cc",
+           "lib/BUILD.bazel", "lib/l.cc", "src/m.cc")
+
+    assert bazel_glob.glob(str(tmp_path), ["**/*.cc"]) == ["a.cc", "src/m.cc"]
+    # Patterns that name the subpackage outright do not reach into it
+    # either.
+    assert bazel_glob.glob(str(tmp_path), ["sub/*.cc"]) == []
+    assert bazel_glob.glob(str(tmp_path), ["sub/deep/*.cc"]) == []
+    assert bazel_glob.glob(str(tmp_path), ["sub/s.cc", "lib/**"]) == []
+    assert bazel_glob.glob(str(tmp_path), ["src/*.cc"]) == ["src/m.cc"]
@@ -0,0 +1,117 @@
+import os
+
+import bazel_to_cmake
+import tracing
+from test_fetch import make_archive
+
+
+def _workspace(root, name):
+    root.mkdir()
+    (root / "WORKSPACE").write_text('workspace(name = "%s")\n' % name)
+    (root / "BUILD").write_text(
+        'cc_library(name = "%s", srcs = ["%s.cc"])\n' % (name, name))
+    (root / (name + ".cc")).write_text("int %s() { return 0; }\n" % name)
+    return str(root)
+
+
+def test_profiling_ends_with_its_conversion(tmp_path, cache_dir):
+    first = _workspace(tmp_path / "first", "first")
+    second = _workspace(tmp_path / "second", "second")
+    trace = str(tmp_path / "trace.json")
+
+    bazel_to_cmake.convert_workspace(
+        first, options = bazel_to_cmake.Options(profile = trace))
+    assert os.path.exists(trace)
+    assert not tracing.enabled()
+
+    bazel_to_cmake.convert_workspace(second)
+    assert not tracing.enabled()
+    assert "add_library(second" in (tmp_path / "second" /
+                                    "CMakeLists.txt").read_text()
+
+
+def test_batch_profiles_each_workspace(tmp_path, cache_dir):
+    workspaces = [_workspace(tmp_path / name, name) for name in ("a", "b")]
+
+    failed = bazel_to_cmake.convert_batch(
+        workspaces, "CMakeLists.txt",
+        bazel_to_cmake.Options(profile = "trace.json"))
+
+    assert failed == []
+    for workspace in workspaces:
+        assert os.path.exists(os.path.join(workspace, "CMakeLists.txt"))
+        assert os.path.exists(os.path.join(workspace, "trace.json"))
+    assert not os.path.exists("trace.json")
+
+
+def test_alias_links_to_the_owners_targets(tmp_path, cache_dir, http_server):
+    make_archive(http_server.root / "z.tar.gz",
+                 {"BUILD": 'cc_library(name = "x", srcs = ["x.cc"])\n',
+                  "x.cc": ""})
+    url = http_server.url + "/z.tar.gz"
+    root = tmp_path / "ws"
+    root.mkdir()
+    (root / "WORKSPACE").write_text(
+        'local_repository(name = "a", path = "a")\n'
+        'local_repository(name = "b", path = "b")\n')
+    (root / "BUILD").write_text(
+        'cc_library(name = "top", srcs = ["t.cc"], deps = ["@b//:b"])\n')
+    (root / "t.cc").write_text("")
+    for name, repo in (("a", "zl"), ("b", "zz")):
+        _workspace(root / name, name)
+        (root / name / "WORKSPACE").write_text(
+            'http_archive(name = "%s", urls = ["%s"], '
+            'strip_prefix = "pkg-1.0")\n' % (repo, url))
+        (root / name / "BUILD").write_text(
+            'cc_library(name = "%s", srcs = ["%s.cc"], deps = ["@%s//:x"])\n'
+            % (name, name, repo))
+
+    bazel_to_cmake.convert_workspace(
+        str(root), options = bazel_to_cmake.Options(split = True))
+
+    # zz is the archive a fetched as zl, into its own package graph.
+    assert "add_library(zl_x" in (root / "a" / "zl" /
+                                  "CMakeLists.txt").read_text()
+    assert "target_link_libraries(a PRIVATE\n  zl_x)" in (
+        root / "a" / "CMakeLists.txt").read_text()
+    assert "target_link_libraries(b PRIVATE\n  zl_x)" in (
+        root / "b" / "CMakeLists.txt").read_text()
+    assert "target_link_libraries(top PRIVATE\n  b)" in (
+        root / "CMakeLists.txt").read_text()
+
+
+def test_submodule_packages_are_converted(tmp_path, cache_dir):
+    root = tmp_path / "ws"
+    _workspace(root, "top")
+    sub = root / "third_party" / "sub"
+    sub.mkdir(parents = True)
+    # A submodule's .git is a file pointing into the superproject's.
+    (sub / ".git").write_text("gitdir: ../../.git/modules/sub\n")
+    (sub / "BUILD").write_text('cc_library(name = "sub", srcs = ["sub.cc"])\n')
+    (sub / "sub.cc").write_text("")
+
+    bazel_to_cmake.convert_workspace(str(root))
+
+    assert "add_library(third_party_sub_sub" in (
+        root / "CMakeLists.txt").read_text()
+
+
+def test_report_removed_deps_option(tmp_path, cache_dir, capsys):
+    root = tmp_path / "ws"
+    root.mkdir()
+    (root / "WORKSPACE").write_text("")
+    (root / "BUILD").write_text(
+        'cc_library(name = "base", srcs = ["base.cc"])\n'
+        'cc_library(name = "pub", srcs = ["pub.cc"], hdrs = ["pub.h"],\n'
+        '           deps = [":base"])\n'
+        'cc_library(name = "a", srcs = ["a.cc"], deps = [":pub", ":base"])\n')
+    for name in ("base.cc", "pub.cc", "pub.h", "a.cc"):
+        (root / name).write_text("")
+
+    bazel_to_cmake.convert_workspace(
+        str(root), options = bazel_to_cmake.Options(report_removed_deps = True))
+
+    assert "Removed dep //:a -> //:base (via //:pub)" in \
+        capsys.readouterr().out
+    assert "target_link_libraries(a PRIVATE\n  pub)" in (
+        root / "CMakeLists.txt").read_text()
@@ -0,0 +1,227 @@
+import hashlib
+import io
+import os
+import shutil
+import socket
+import tarfile
+import time
+import zipfile
+
+import pytest
+
+import cache
+import fetch
+
+
+def make_archive(path, files, prefix = "pkg-1.0"):
+    """Writes a .tar.gz of files ({name: text}) under prefix to path;
+    returns its sha256."""
+    with tarfile.open(str(path), "w:gz") as tf:
+        for name, text in sorted(files.items()):
+            data = text.encode("utf-8")
+            info = tarfile.TarInfo(prefix + "/" + name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    with open(str(path), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def write_workspace(path, archives):
+    with open(str(path), "w") as f:
+        for name, urls, sha256 in archives:
+            f.write("http_archive(\n    name = %r,\n    urls = %r,\n"
+                    "    sha256 = %r,\n    strip_prefix = 'pkg-1.0',\n)\n" % (
+                        name, urls, sha256))
+
+
+def test_prefetch_skips_dead_mirror(tmp_path, cache_dir, http_server,
+                                    dead_url):
+    sha256 = make_archive(http_server.root / "a.tar.gz", {"BUILD": "# a\n"})
+    workspace = tmp_path / "WORKSPACE"
+    write_workspace(workspace, [
+        ("a", [dead_url, http_server.url + "/a.tar.gz"], sha256)])
+
+    fetch.prefetch(str(workspace), str(tmp_path / "repos"))
+
+    assert (tmp_path / "repos" / "a" / "BUILD").read_text() == "# a\n"
+
+
+def test_prefetch_rejects_sha256_mismatch(tmp_path, cache_dir, http_server,
+                                          capsys):
+    make_archive(http_server.root / "a.tar.gz", {"BUILD": "# a\n"})
+    workspace = tmp_path / "WORKSPACE"
+    write_workspace(workspace, [
+        ("a", [http_server.url + "/a.tar.gz"], "0" * 64)])
+
+    fetch.prefetch(str(workspace), str(tmp_path / "repos"))
+
+    assert "Failed to prefetch a" in capsys.readouterr().out
+    assert not (tmp_path / "repos" / "a").exists()
+    assert fetch.download_cache().get("0" * 64) is None
+
+
+def test_prefetch_fetches_concurrently(tmp_path, cache_dir, http_server):
+    archives = []
+    for name in ("a", "b", "c", "d"):
+        sha256 = make_archive(http_server.root / (name + ".tar.gz"),
+                              {"BUILD": "# %s\n" % name})
+        archives.append((name, [http_server.url + "/%s.tar.gz" % name],
+                         sha256))
+    workspace = tmp_path / "WORKSPACE"
+    write_workspace(workspace, archives)
+    http_server.delay = 0.5
+
+    start = time.perf_counter()
+    fetch.prefetch(str(workspace), str(tmp_path / "repos"))
+    elapsed = time.perf_counter() - start
+
+    for name, _, _ in archives:
+        assert (tmp_path / "repos" / name / "BUILD").exists()
+    # Fetched one after another this would take at least 2s.
+    assert elapsed < 1.5
+
+
+def test_download_races_mirrors_and_caches(cache_dir, http_server, dead_url):
+    sha256 = make_archive(http_server.root / "a.tar.gz", {"BUILD": "# a\n"})
+    live = http_server.url + "/a.tar.gz"
+
+    url, path = fetch.download("a", [dead_url, live], sha256)
+    assert url == live
+    with open(path, "rb") as f:
+        assert hashlib.sha256(f.read()).hexdigest() == sha256
+
+    # A second download is served from the cache.
+    os.remove(str(http_server.root / "a.tar.gz"))
+    assert fetch.download("a", [dead_url, live], sha256)[1] == path
+
+
+def test_extract_refuses_chained_symlinks(tmp_path):
+    archive = tmp_path / "evil.tar"
+    with tarfile.open(str(archive), "w") as tf:
+        for name, target in (("x", "y/.."), ("y", ".")):
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.SYMTYPE
+            info.linkname = target
+            tf.addfile(info)
+        info = tarfile.TarInfo("x/evil")
+        info.size = 4
+        tf.addfile(info, io.BytesIO(b"evil"))
+    dest = tmp_path / "dest"
+    dest.mkdir()
+
+    with pytest.raises(fetch.FetchError):
+        fetch.extract_archive(str(archive), str(dest))
+    assert not (tmp_path / "evil").exists()
+
+
+def test_fetch_archive_honours_type_and_query(tmp_path, cache_dir,
+                                              http_server):
+    sha256 = make_archive(http_server.root / "download", {"BUILD": "# a\n"})
+    make_archive(http_server.root / "b.tar.gz", {"BUILD": "# b\n"})
+
+    fetch.fetch_archive("a", [http_server.url + "/download?id=1"],
+                        str(tmp_path / "a"), "pkg-1.0", sha256,
+                        archive_type = "tar.gz")
+    fetch.fetch_archive("b", [http_server.url + "/b.tar.gz?raw=1"],
+                        str(tmp_path / "b"), "pkg-1.0")
+
+    assert (tmp_path / "a" / "BUILD").read_text() == "# a\n"
+    assert (tmp_path / "b" / "BUILD").read_text() == "# b\n"
+    assert fetch.archive_format(fetch.archive_name("", "zip")) == "zip"
+    assert fetch.archive_format(fetch.archive_name("", "tgz")) == "gz"
+
+
+def test_fetch_archive_does_not_wait_for_silent_mirror(tmp_path, cache_dir,
+                                                       http_server,
+                                                       monkeypatch):
+    make_archive(http_server.root / "a.tar.gz", {"BUILD": "# a\n"})
+    monkeypatch.setattr(fetch, "TIMEOUT", 3)
+    # Accepts connections but never answers.
+    with socket.socket() as silent:
+        silent.bind(("127.0.0.1", 0))
+        silent.listen(8)
+        silent_url = "http://127.0.0.1:%d/a.tar.gz" % silent.getsockname()[1]
+
+        start = time.perf_counter()
+        fetch.fetch_archive("a", [silent_url, http_server.url + "/a.tar.gz"],
+                            str(tmp_path / "a"), "pkg-1.0")
+        elapsed = time.perf_counter() - start
+
+    assert (tmp_path / "a" / "BUILD").exists()
+    assert elapsed < 1.5
+
+
+def test_fetch_respects_cache_budget(tmp_path, cache_dir, http_server,
+                                     monkeypatch):
+    big = os.urandom(50000).hex()
+    sha_a = make_archive(http_server.root / "a.tar.gz",
+                         {"BUILD": "# a\n", "big": big})
+    sha_b = make_archive(http_server.root / "b.tar.gz",
+                         {"BUILD": "# b\n", "big": big})
+    monkeypatch.setenv("BAZEL_TO_CMAKE_CACHE_MAX_BYTES", "10")
+
+    fetch.fetch_archive("a", [http_server.url + "/a.tar.gz"],
+                        str(tmp_path / "a"), "pkg-1.0", sha_a)
+    fetch.fetch_archive("b", [http_server.url + "/b.tar.gz"],
+                        str(tmp_path / "b"), "pkg-1.0", sha_b)
+
+    # The older entry makes room; the one just added is kept.
+    assert (tmp_path / "b" / "BUILD").read_text() == "# b\n"
+    assert fetch.download_cache().get(sha_a) is None
+    assert fetch.download_cache().get(sha_b) is not None
+
+
+def test_zip_fetch_within_tiny_cache_budget(tmp_path, cache_dir, http_server,
+                                            monkeypatch):
+    with zipfile.ZipFile(str(http_server.root / "a.zip"), "w") as zf:
+        zf.writestr("pkg-1.0/BUILD", "# a\n")
+    monkeypatch.setenv("BAZEL_TO_CMAKE_CACHE_MAX_BYTES", "10")
+
+    fetch.fetch_archive("a", [http_server.url + "/a.zip"],
+                        str(tmp_path / "a"), "pkg-1.0")
+
+    assert (tmp_path / "a" / "BUILD").read_text() == "# a\n"
+
+
+def test_evict_skips_locked_entries(tmp_path):
+    store = cache.DownloadCache(str(tmp_path / "cas"), max_bytes = 0)
+    for key in ("aa", "bb"):
+        f, out = store.temp_file()
+        with f:
+            f.write(b"data")
+        store.insert(key, out)
+
+    with store.lock("aa", shared = True):
+        store.evict()
+    assert store.get("aa") is not None
+    assert store.get("bb") is None
+    store.evict()
+    assert store.get("aa") is None
+
+
+def test_race_removes_late_downloads(cache_dir, http_server):
+    sha256 = make_archive(http_server.root / "a.tar.gz", {"BUILD": "# a\n"})
+    shutil.copy(str(http_server.root / "a.tar.gz"),
+                str(http_server.root / "b.tar.gz"))
+
+    fetch.download("a", [http_server.url + "/a.tar.gz",
+                         http_server.url + "/b.tar.gz"], sha256)
+
+    tmp = cache_dir / "cas" / "tmp"
+    deadline = time.monotonic() + 2
+    while os.listdir(str(tmp)) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert os.listdir(str(tmp)) == []
+
+
+def test_cache_key_does_not_depend_on_mirror(tmp_path, cache_dir,
+                                             http_server, dead_url):
+    make_archive(http_server.root / "a.tar.gz", {"BUILD": "# a\n"})
+    urls = [dead_url, http_server.url + "/a.tar.gz"]
+
+    fetch.fetch_archive("a", urls, str(tmp_path / "first"), "pkg-1.0")
+    # Without a sha256 the entry is found by the URLs, whichever won.
+    os.remove(str(http_server.root / "a.tar.gz"))
+    fetch.fetch_archive("a", urls, str(tmp_path / "second"), "pkg-1.0")
+
+    assert (tmp_path / "second" / "BUILD").read_text() == "# a\n"
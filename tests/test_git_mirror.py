@@ -0,0 +1,96 @@
+import json
+import os
+import subprocess
+
+import git_mirror
+
+
+def _git(cwd, *args):
+    return subprocess.check_output(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com",
+         "-c", "init.defaultBranch=main"] + list(args),
+        cwd = str(cwd)).decode("utf-8").strip()
+
+
+def _commit_files(work, files, message):
+    for name, text in files.items():
+        path = work / name
+        path.parent.mkdir(parents = True, exist_ok = True)
+        path.write_text(text)
+    _git(work, "add", "-A")
+    _git(work, "commit", "-q", "-m", message)
+    _git(work, "push", "-q", "origin", "HEAD:main")
+    return _git(work, "rev-parse", "HEAD")
+
+
+def _make_remote(tmp_path):
+    """Returns (bare remote path, work tree pushing to it, first commit)."""
+    remote = tmp_path / "remote.git"
+    work = tmp_path / "work"
+    _git(tmp_path, "init", "-q", "--bare", str(remote))
+    _git(tmp_path, "init", "-q", str(work))
+    _git(work, "remote", "add", "origin", str(remote))
+    commit = _commit_files(work, {
+        "a/BUILD": "# a\n",
+        "a/a.cc": "",
+        "b/BUILD": "# b\n",
+        "c/BUILD": "# c\n",
+        "tools/defs.bzl": "# defs\n",
+    }, "first")
+    return str(remote), work, commit
+
+
+def _files(root):
+    found = set()
+    for directory, dirs, files in os.walk(str(root)):
+        for name in files:
+            if name != ".git":
+                found.add(os.path.relpath(os.path.join(directory, name),
+                                          str(root)))
+    return found
+
+
+def test_pinned_commit_is_recorded_and_kept(tmp_path):
+    remote, work, commit = _make_remote(tmp_path)
+    pins = tmp_path / "pins.json"
+    mirror = git_mirror.GitMirror(str(tmp_path / "cache"), str(pins))
+
+    assert mirror.pinned_commit(remote) == commit
+    assert remote in pins.read_text()
+
+    # A new commit upstream does not move the pin, in this run or the next.
+    _commit_files(work, {"a/BUILD": "# a, changed\n"}, "second")
+    assert mirror.pinned_commit(remote) == commit
+    again = git_mirror.GitMirror(str(tmp_path / "cache"), str(pins))
+    assert again.pinned_commit(remote) == commit
+
+
+def test_each_pins_file_pins_on_its_own(tmp_path):
+    remote, work, first = _make_remote(tmp_path)
+    mirror = git_mirror.GitMirror(str(tmp_path / "cache"),
+                                  str(tmp_path / "default.json"))
+    old = tmp_path / "old.json"
+    assert mirror.pinned_commit(remote, str(old)) == first
+
+    # A pins file new to the remote pins its current HEAD, not the one
+    # the mirror was made with.
+    second = _commit_files(work, {"b/BUILD": "# b, changed\n"}, "second")
+    new = tmp_path / "new.json"
+    assert mirror.pinned_commit(remote, str(new)) == second
+    assert json.loads(new.read_text()) == {remote: second}
+    assert mirror.pinned_commit(remote, str(old)) == first
+    assert not (tmp_path / "default.json").exists()
+
+
+def test_checkout_is_sparse_and_widens(tmp_path):
+    remote, _, _ = _make_remote(tmp_path)
+    mirror = git_mirror.GitMirror(str(tmp_path / "cache"),
+                                  str(tmp_path / "pins.json"))
+    dest = tmp_path / "ws" / "external" / "repo"
+
+    mirror.checkout(remote, str(dest), ["a"])
+    assert _files(dest) == {"a/BUILD", "a/a.cc", "tools/defs.bzl"}
+
+    mirror.checkout(remote, str(dest), ["b"])
+    assert _files(dest) == {"a/BUILD", "a/a.cc", "b/BUILD",
+                            "tools/defs.bzl"}
@@ -0,0 +1,214 @@
+import os
+
+# Registers the emitters.
+import bazel_to_cmake
+import target_graph
+from converter import Converter
+from target_graph import Target
+
+
+def test_cmake_name_is_package_qualified():
+    assert target_graph.cmake_name("", "util") == "util"
+    assert target_graph.cmake_name("a", "util") == "a_util"
+    assert target_graph.cmake_name("b/c", "util") == "b_c_util"
+    assert target_graph.cmake_name("third_party/x", "x@1") == \
+        "third_party_x_x_1"
+
+
+def test_same_name_in_two_packages(tmp_path):
+    converter = Converter(str(tmp_path))
+    converter.add_target(Target("cc_library", "a", "util", srcs = ["a/u.cc"]))
+    converter.add_target(Target("cc_library", "b", "util", srcs = ["b/u.cc"]))
+    converter.add_target(Target("cc_library", "", "top", srcs = ["t.cc"],
+                                deps = ["//a:util", "//b:util"]))
+
+    text = converter.convert()
+
+    assert "add_library(a_util\n" in text
+    assert "add_library(b_util\n" in text
+    assert "target_link_libraries(top PRIVATE\n  a_util\n  b_util)" in text
+
+
+def test_colliding_cmake_names_get_a_suffix(tmp_path):
+    converter = Converter(str(tmp_path))
+    converter.add_target(Target("cc_library", "a/b", "c", srcs = ["a/b/c.cc"]))
+    converter.add_target(Target("cc_library", "a", "b_c", srcs = ["a/c.cc"]))
+    converter.add_target(Target("cc_library", "", "a_util", srcs = ["u.cc"]))
+    converter.add_target(Target("cc_library", "a", "util", srcs = ["a/u.cc"]))
+    converter.add_target(Target("cc_library", "", "top", srcs = ["t.cc"],
+                                deps = ["//a:b_c", "//a:util"]))
+
+    text = converter.convert()
+
+    assert converter.graph.cmake_names == [
+        "a_b_c", "a_b_c_2", "a_util", "a_util_2", "top"]
+    assert "add_library(a_b_c_2\n  a/c.cc)" in text
+    assert "target_link_libraries(top PRIVATE\n  a_b_c_2\n  a_util_2)" in text
+
+
+def test_unresolved_deps_are_reported_not_linked(tmp_path):
+    converter = Converter(str(tmp_path))
+    converter.add_target(Target("cc_library", "", "top", srcs = ["t.cc"],
+                                deps = ["//third_party/lib", "@zlib"]))
+
+    text = converter.convert()
+
+    assert "target_link_libraries(top PRIVATE\n  zlib)" in text
+    assert "third_party" not in text
+    assert bazel_to_cmake.unresolved_deps(converter) == [
+        ("//:top", "//third_party/lib:lib")]
+
+
+def test_copts_and_precompiled_headers_stay_private(tmp_path, monkeypatch):
+    monkeypatch.setattr(bazel_to_cmake, "performance", True)
+    converter = Converter(str(tmp_path))
+    converter.add_target(Target("cc_library", "", "hdr", hdrs = ["hdr.h"],
+                                copts = ["-Wall"]))
+    converter.add_target(Target("cc_library", "", "lib", srcs = ["lib.cc"],
+                                hdrs = ["lib.h"], copts = ["-Wall"]))
+    for name in ("a", "b", "c"):
+        converter.add_target(Target("cc_library", "", name,
+                                    srcs = [name + ".cc"], deps = [":lib"]))
+
+    text = converter.convert()
+
+    assert "target_compile_options(hdr" not in text
+    assert "target_compile_options(lib PRIVATE\n  -Wall)" in text
+    assert "target_precompile_headers(lib PRIVATE\n" in text
+
+
+def _graph(*targets):
+    graph = target_graph.TargetGraph()
+    for target in targets:
+        graph.add(target)
+    return graph
+
+
+def _reduce(graph):
+    kept, removed = graph.transitive_reduction(bazel_to_cmake._propagates_deps)
+    label = lambda i: None if i is None else graph.targets[i].label
+    return ({graph.targets[i].label: [label(d) for d in deps]
+             for i, deps in enumerate(kept)},
+            [(label(i), label(d), label(v)) for i, d, v in removed])
+
+
+def test_link_keyword_follows_headers():
+    assert bazel_to_cmake._link_keyword(
+        Target("cc_library", "", "h", hdrs = ["h.h"])) == "INTERFACE"
+    assert bazel_to_cmake._link_keyword(
+        Target("cc_library", "", "p", srcs = ["p.cc"],
+               hdrs = ["p.h"])) == "PUBLIC"
+    assert bazel_to_cmake._link_keyword(
+        Target("cc_library", "", "t", srcs = ["t.cc"],
+               textual_hdrs = ["t.inc"])) == "PUBLIC"
+    assert bazel_to_cmake._link_keyword(
+        Target("cc_library", "", "q", srcs = ["q.cc"])) == "PRIVATE"
+
+
+def test_reduction_drops_deps_passed_on_publicly():
+    graph = _graph(
+        Target("cc_library", "", "base", srcs = ["base.cc"]),
+        Target("cc_library", "", "pub", srcs = ["pub.cc"], hdrs = ["pub.h"],
+               deps = [":base"]),
+        Target("cc_library", "", "hdr", hdrs = ["hdr.h"], deps = [":base"]),
+        Target("cc_library", "", "a", srcs = ["a.cc"],
+               deps = [":pub", ":base"]),
+        Target("cc_library", "", "b", srcs = ["b.cc"],
+               deps = [":base", ":hdr"]))
+
+    kept, removed = _reduce(graph)
+
+    assert kept["//:a"] == ["//:pub"]
+    assert kept["//:b"] == ["//:hdr"]
+    assert removed == [("//:a", "//:base", "//:pub"),
+                       ("//:b", "//:base", "//:hdr")]
+
+
+def test_reduction_keeps_deps_behind_private_links():
+    graph = _graph(
+        Target("cc_library", "", "base", srcs = ["base.cc"]),
+        Target("cc_library", "", "priv", srcs = ["priv.cc"],
+               deps = [":base"]),
+        # PUBLIC, but only passes on priv, which keeps base to itself.
+        Target("cc_library", "", "pub", srcs = ["pub.cc"], hdrs = ["pub.h"],
+               deps = [":priv"]),
+        Target("cc_library", "", "a", srcs = ["a.cc"],
+               deps = [":priv", ":base"]),
+        Target("cc_library", "", "b", srcs = ["b.cc"],
+               deps = [":pub", ":base"]))
+
+    kept, removed = _reduce(graph)
+
+    assert kept["//:a"] == ["//:priv", "//:base"]
+    assert kept["//:b"] == ["//:pub", "//:base"]
+    assert removed == []
+
+
+def test_reduction_drops_duplicate_deps():
+    graph = _graph(
+        Target("cc_library", "", "base", srcs = ["base.cc"]),
+        Target("cc_library", "", "a", srcs = ["a.cc"],
+               deps = [":base", "//:base", ":base"]))
+
+    kept, removed = _reduce(graph)
+
+    assert kept["//:a"] == ["//:base"]
+    assert removed == [("//:a", "//:base", None), ("//:a", "//:base", None)]
+
+
+def test_report_removed_deps(tmp_path, capsys):
+    converter = Converter(str(tmp_path))
+    converter.add_target(Target("cc_library", "", "base", srcs = ["base.cc"]))
+    converter.add_target(Target("cc_library", "", "pub", srcs = ["pub.cc"],
+                                hdrs = ["pub.h"], deps = [":base"]))
+    converter.add_target(Target("cc_library", "", "a", srcs = ["a.cc"],
+                                deps = [":pub", ":base", ":pub"]))
+
+    assert "target_link_libraries(a PRIVATE\n  pub)" in converter.convert()
+    bazel_to_cmake.report_removed_deps(converter)
+
+    assert capsys.readouterr().out.splitlines() == [
+        "Removed dep //:a -> //:base (via //:pub)",
+        "Removed dep //:a -> //:pub (duplicate)",
+        "Removed 2 redundant deps from " + str(tmp_path),
+    ]
+
+
+def test_alwayslink_is_static_and_linked_whole(tmp_path):
+    converter = Converter(str(tmp_path))
+    converter.add_target(Target("cc_library", "", "reg", srcs = ["reg.cc"],
+                                alwayslink = True))
+    converter.add_target(Target("cc_library", "", "pub", srcs = ["pub.cc"],
+                                hdrs = ["pub.h"], deps = [":reg"]))
+    converter.add_target(Target("cc_library", "", "a", srcs = ["a.cc"],
+                                deps = [":pub", ":reg"]))
+
+    text = converter.convert()
+
+    assert "add_library(reg STATIC\n" in text
+    assert "$<LINK_LIBRARY:WHOLE_ARCHIVE," in text
+    assert "-Wl,--whole-archive" in text
+    whole = ("${BAZEL_TO_CMAKE_WHOLE_ARCHIVE_BEGIN}reg"
+             "${BAZEL_TO_CMAKE_WHOLE_ARCHIVE_END}")
+    assert "target_link_libraries(pub PUBLIC\n  %s)" % whole in text
+    # Not dropped even though pub passes it on.
+    assert "target_link_libraries(a PRIVATE\n  pub\n  %s)" % whole in text
+
+
+def test_missing_sources_are_listed(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "here.cc").write_text("")
+    converter = Converter(str(tmp_path))
+    converter.add_target(Target("cc_library", "a", "gen", srcs = ["a/gen.h"]))
+    converter.add_target(Target("cc_library", "a", "lib",
+                                srcs = ["a/here.cc", "a/gone.cc", ":gen",
+                                        "@other//:x.cc"],
+                                hdrs = ["a/gone.h"],
+                                textual_hdrs = ["//a:lost.inc"]))
+
+    assert bazel_to_cmake.missing_sources(converter) == [
+        ("//a:gen", os.path.join("a", "gen.h")),
+        ("//a:lib", os.path.join("a", "gone.cc")),
+        ("//a:lib", os.path.join("a", "gone.h")),
+        ("//a:lib", os.path.join("a", "lost.inc")),
+    ]
@@ -0,0 +1,147 @@
+"""Built-in profiler for conversion runs.
+
+While enabled, span() records how long each fetch, extraction, git
+operation, file evaluation, rule handler, glob and emit phase took, with
+the file or label it worked on.  write() saves the spans as Chrome
+trace-event JSON (load it in chrome://tracing or Perfetto), and
+summary() tabulates where the time went.  (The module is not called
+profile so as not to shadow the standard library's.)
+
+When disabled, span() returns one shared no-op context manager and rule
+handlers are not wrapped at all, so the cost is a global lookup per
+span.
+"""
+
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # No getrusage on this platform; the summary leaves out peak RSS.
+    resource = None
+
+_events = None
+_start = 0
+_null = contextlib.nullcontext()
+
+
+def enable():
+    global _events, _start
+    _events = []
+    _start = time.perf_counter()
+
+
+def disable():
+    global _events
+    _events = None
+
+
+def enabled():
+    return _events is not None
+
+
+def save_state():
+    """Returns the profiler's state, for restore_state()."""
+    return _events, _start
+
+
+def restore_state(state):
+    global _events, _start
+    _events, _start = state
+
+
+@contextlib.contextmanager
+def _span(name, category, args):
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (begin - _start) * 1e6,
+            "dur": (end - begin) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+
+
+def span(name, category, **args):
+    """Returns a context manager recording a span while profiling."""
+    if _events is None:
+        return _null
+    return _span(name, category, args)
+
+
+def wrap_rule(name, handler):
+    """Returns handler recording a "rule" span for each call."""
+    def profiled(*args, **kwargs):
+        with _span(name, "rule", {"label": str(kwargs.get("name", ""))}):
+            return handler(*args, **kwargs)
+    profiled.__name__ = name
+    return profiled
+
+
+def take_events():
+    """Returns and forgets the spans recorded so far, for merging the
+    spans of a worker process into its parent with add_events()."""
+    if _events is None:
+        return []
+    events = list(_events)
+    del _events[:]
+    return events
+
+
+def add_events(events):
+    if _events is not None:
+        _events.extend(events)
+
+
+def peak_rss():
+    """Returns the peak resident set size of this process and its
+    children, in bytes, or None where it cannot be measured."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux.
+    return 1024 * max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                      resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def write(path):
+    with open(path, "w") as f:
+        json.dump({"traceEvents": _events, "displayTimeUnit": "ms"}, f)
+
+
+def summary(kinds, top = 20):
+    """Returns a table of the top spans by total time, the number of
+    targets of each rule kind (given as a Counter), and peak RSS."""
+    totals = collections.defaultdict(lambda: [0, 0.0])
+    for event in _events:
+        total = totals[(event["cat"], event["name"])]
+        total[0] += 1
+        total[1] += event["dur"]
+
+    lines = ["%-10s %-50s %8s %12s" % ("category", "span", "count", "total ms")]
+    for (category, name), (count, dur) in sorted(
+            totals.items(), key = lambda item: -item[1][1])[:top]:
+        if len(name) > 50:
+            name = "..." + name[-47:]
+        lines.append("%-10s %-50s %8d %12.1f" % (category, name, count,
+                                                 dur / 1000))
+    lines.append("")
+    lines.append("%-50s %8s" % ("rule kind", "count"))
+    for kind, count in kinds.most_common():
+        lines.append("%-50s %8d" % (kind, count))
+    rss = peak_rss()
+    if rss is not None:
+        lines.append("")
+        lines.append("Peak RSS: %.1f MiB" % (rss / float(1 << 20)))
+    return "\n".join(lines)
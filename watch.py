@@ -0,0 +1,214 @@
+"""Waiting for changes to the files a conversion read.
+
+A watcher is given the directories to watch, none of them recursively,
+and wait() blocks until something in them changes.  It returns a dict
+mapping each changed path to True if it was created, deleted or renamed
+(so the listing of its directory changed) or False if only its contents
+changed.  Changes are collected until none has arrived for DEBOUNCE
+seconds, so an editor's save or a checkout is reported once.
+
+On Linux the watcher uses inotify, through ctypes; elsewhere, or when
+inotify is unavailable or out of watches, it stats the directories every
+POLL_INTERVAL seconds instead.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+DEBOUNCE = 0.05
+POLL_INTERVAL = 0.5
+
+# From <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_CONTENTS = IN_MODIFY | IN_CLOSE_WRITE
+_ENTRIES = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_SELF = IN_DELETE_SELF | IN_MOVE_SELF
+_EVENT = struct.Struct("iIII")
+
+
+def walk(root):
+    """Returns root and every directory beneath it, except hidden ones
+    and bazel-* output symlinks."""
+    found = []
+    stack = [os.path.abspath(root)]
+    while stack:
+        path = stack.pop()
+        found.append(path)
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.name.startswith(".") or \
+                            entry.name.startswith("bazel-"):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks = False):
+                            stack.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return found
+
+
+class InotifyWatcher(object):
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno = True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                    ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}
+        self._wds = {}
+
+    def close(self):
+        os.close(self._fd)
+
+    def watch(self, dirs):
+        """Watches exactly the directories dirs from now on."""
+        dirs = set(os.path.abspath(d) for d in dirs)
+        for path in set(self._dirs) - dirs:
+            self._rm_watch(self._fd, self._dirs.pop(path))
+        for path in dirs - set(self._dirs):
+            wd = self._add_watch(self._fd, os.fsencode(path),
+                                 _CONTENTS | _ENTRIES | _SELF | IN_ONLYDIR)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                    continue
+                raise OSError(error, "inotify_add_watch failed: " + path)
+            self._dirs[path] = wd
+            self._wds[wd] = path
+
+    def _read(self, changed):
+        """Adds the pending events to changed; returns False on overflow."""
+        try:
+            data = os.read(self._fd, 1 << 16)
+        except BlockingIOError:
+            return True
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            name = data[pos:pos + length].rstrip(b"\0")
+            pos += length
+            if mask & IN_Q_OVERFLOW:
+                return False
+            directory = self._wds.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._wds[wd]
+                if self._dirs.get(directory) == wd:
+                    del self._dirs[directory]
+                continue
+            if mask & _SELF:
+                changed[directory] = True
+            elif name:
+                path = os.path.join(directory, os.fsdecode(name))
+                changed[path] = changed.get(path, False) or \
+                    bool(mask & _ENTRIES)
+        return True
+
+    def wait(self):
+        """Blocks until something changes; see the module docstring.
+
+        Returns None if the kernel dropped events, so it is not known
+        what changed.
+        """
+        changed = {}
+        timeout = None
+        while True:
+            ready, _, _ = select.select([self._fd], [], [], timeout)
+            if not ready and changed:
+                return changed
+            if ready and not self._read(changed):
+                return None
+            if changed:
+                timeout = DEBOUNCE
+
+
+class PollingWatcher(object):
+    def __init__(self):
+        self._snapshots = {}
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _snapshot(path):
+        entries = {}
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        entries[entry.name] = entry.stat(
+                            follow_symlinks = False).st_mtime_ns
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        return entries
+
+    def watch(self, dirs):
+        """Watches exactly the directories dirs from now on."""
+        dirs = set(os.path.abspath(d) for d in dirs)
+        for path in set(self._snapshots) - dirs:
+            del self._snapshots[path]
+        for path in dirs - set(self._snapshots):
+            self._snapshots[path] = self._snapshot(path)
+
+    def _poll(self, changed):
+        for path, old in self._snapshots.items():
+            new = self._snapshot(path)
+            if new == old:
+                continue
+            self._snapshots[path] = new
+            if old is None or new is None:
+                changed[path] = True
+                continue
+            for name in set(old) | set(new):
+                if old.get(name) != new.get(name):
+                    child = os.path.join(path, name)
+                    changed[child] = changed.get(child, False) or \
+                        name not in old or name not in new
+
+    def wait(self):
+        """Blocks until something changes; see the module docstring."""
+        changed = {}
+        while True:
+            count = len(changed)
+            time.sleep(DEBOUNCE if changed else POLL_INTERVAL)
+            self._poll(changed)
+            if changed and len(changed) == count:
+                return changed
+
+
+def watcher():
+    """Returns an inotify watcher if possible, or else a polling one."""
+    try:
+        return InotifyWatcher()
+    except (OSError, AttributeError, TypeError):
+        # No inotify (not Linux, or no libc to load it from).
+        return PollingWatcher()